@@ -3,27 +3,29 @@ Create Checkpoint for Manual Review - CORRECTED VERSION
 This creates a checkpoint that STAYS PENDING for manual review in UI
 """
 import asyncio
-import json
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 
-from src.workflow import InvoiceProcessingWorkflow
-from src.tools.checkpoint_db import checkpoint_db
+from src.workflow import InvoiceProcessingWorkflow, load_json
+from src.tools.checkpoint_db import checkpoint_db, payload_hash
+from invoice_factory import load_sample_payload
 
 
-async def create_pending_checkpoint():
+async def create_pending_checkpoint(reuse_cache: bool = True):
     """
     Create a checkpoint that will STAY PENDING for manual review
+    
+    With reuse_cache, a replay of a payload that is already pending review
+    returns the existing checkpoint instead of running the graph again.
     """
     print("\n" + "=" * 80)
     print("🎬 CREATING PENDING CHECKPOINT FOR MANUAL REVIEW")
     print("=" * 80 + "\n")
     
     # Load invoice that will fail matching
-    with open("config/sample_invoice_fail_match.json", "r") as f:
-        invoice_payload = json.load(f)
+    invoice_payload = load_sample_payload("config/sample_invoice_fail_match.json")
     
     print(f"Processing invoice: {invoice_payload['invoice_id']}")
     print(f"Vendor: {invoice_payload['vendor_name']}")
@@ -32,31 +34,50 @@ async def create_pending_checkpoint():
     print(f"Expected Match Score: ~0.85 (below 0.90 threshold)")
     print()
     
+    content_hash = payload_hash(invoice_payload)
+    if reuse_cache:
+        cached_checkpoint = await asyncio.to_thread(
+            checkpoint_db.get_pending_by_payload_hash, content_hash
+        )
+        if cached_checkpoint:
+            print(f"♻️  Identical invoice already pending review: {cached_checkpoint}")
+            print()
+            return
+    
     # Initialize workflow
-    workflow = InvoiceProcessingWorkflow("config/workflow.json")
+    workflow = InvoiceProcessingWorkflow(
+        workflow_config=load_json("config/workflow.json")
+    )
     
     # Run workflow - it will pause at checkpoint
-    # We'll modify the workflow to NOT auto-continue in HITL_DECISION
+    # The graph interrupts before HITL_DECISION, so nothing auto-continues
     print("Starting workflow...")
     print("This will create a checkpoint and STOP (not auto-accept)")
     print()
     
     try:
         # Run through the graph
-        async for state_update in workflow.graph.astream(
+        stream = workflow.graph.astream(
             {"invoice_payload": invoice_payload,
-             "audit_log": [],
+             "audit_log": (),
              "bigtool_selections": {},
              "errors": []},
             {"configurable": {"thread_id": "manual_demo"}}
-        ):
+        )
+        async for state_update in stream:
             for node_name, node_output in state_update.items():
+                if node_name == "__interrupt__":
+                    continue
                 print(f"✓ Completed: {node_name}")
                 
-                # If we reach CHECKPOINT_HITL, stop here
+                # CHECKPOINT_HITL is the last node before the interrupt
                 if node_name == "CHECKPOINT_HITL":
-                    checkpoint_id = node_output.get("checkpoint_id")
+                    checkpoint_id = node_output.get("checkpoint_ref")
                     review_url = node_output.get("review_url")
+                    if checkpoint_id:
+                        await asyncio.to_thread(
+                            checkpoint_db.record_payload_hash, content_hash, checkpoint_id
+                        )
                     
                     print("\n" + "=" * 80)
                     print("✅ CHECKPOINT CREATED AND PENDING!")
@@ -77,13 +98,16 @@ async def create_pending_checkpoint():
                     print("=" * 80 + "\n")
                     
                     # Show pending reviews
-                    pending = checkpoint_db.get_pending_reviews()
-                    print(f"Total pending reviews in database: {len(pending)}")
-                    for review in pending:
-                        print(f"  📋 {review['invoice_id']}: {review['reason_for_hold']}")
-                    print()
-                    
-                    return  # STOP HERE - don't continue to HITL_DECISION
+                    pending = await asyncio.to_thread(checkpoint_db.get_pending_reviews)
+                    body = "\n".join(
+                        f"  📋 {review['invoice_id']}: {review['reason_for_hold']}"
+                        for review in pending
+                    )
+                    sys.stdout.write(
+                        f"Total pending reviews in database: {len(pending)}\n"
+                        + (body + "\n" if body else "")
+                        + "\n"
+                    )
     
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -91,4 +115,11 @@ async def create_pending_checkpoint():
 
 
 if __name__ == "__main__":
+    # Use uvloop's faster event loop where it is installed
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    
     asyncio.run(create_pending_checkpoint())
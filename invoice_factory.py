@@ -0,0 +1,71 @@
+"""
+Invoice Payload Factory
+Shared payload builders for the demo checkpoint scripts
+"""
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List
+
+from src.workflow import load_json
+
+VENDORS = ["Tech Solutions Inc", "Office Supplies Co", "Global logistics", "Cloud Services Ltd", "Marketing Pro Agency"]
+INVOICE_PREFIXES = ["INV", "BIL", "REC", "2025"]
+
+
+def build_invoice_payload(
+    invoice_id: str,
+    vendor: str,
+    amount: float,
+    vendor_tax_id: str,
+    invoice_date: str,
+    due_date: str
+) -> Dict[str, Any]:
+    """Build an invoice payload that fails matching"""
+    
+    # Make sure it fails matching (PO amount is usually fixed or simulated)
+    # In this mock setup, let's assume PO is always 10% higher or lower to cause mismatch
+    
+    return {
+        "invoice_id": invoice_id,
+        "vendor_name": vendor,
+        "vendor_tax_id": vendor_tax_id,
+        "invoice_date": invoice_date,
+        "due_date": due_date,
+        "amount": amount,
+        "currency": "USD",
+        "line_items": [
+             {"desc": "Service Fee", "qty": 1, "unit_price": amount, "total": amount}
+        ],
+        "attachments": []
+    }
+
+
+def build_random_payloads(count: int, rng: random.Random, today: date) -> List[Dict[str, Any]]:
+    """Bulk-draw random fields from one generator and build the payloads"""
+    
+    vendors = rng.choices(VENDORS, k=count)
+    amounts = [round(rng.uniform(500.0, 5000.0), 2) for _ in range(count)]
+    invoice_ids = [
+        f"{rng.choice(INVOICE_PREFIXES)}-2025-{rng.randrange(1000, 10000)}"
+        for _ in range(count)
+    ]
+    tax_ids = [f"TAX-{rng.randrange(10000, 100000)}" for _ in range(count)]
+    date_offsets = [rng.randrange(1, 11) for _ in range(count)]
+    due_date = (today + timedelta(days=30)).isoformat()
+    
+    return [
+        build_invoice_payload(
+            invoice_ids[i],
+            vendors[i],
+            amounts[i],
+            tax_ids[i],
+            (today - timedelta(days=date_offsets[i])).isoformat(),
+            due_date
+        )
+        for i in range(count)
+    ]
+
+
+def load_sample_payload(path: str = "config/sample_invoice_fail_match.json") -> Dict[str, Any]:
+    """Load a sample invoice payload (memoized, do not mutate)"""
+    return load_json(path)
@@ -2,18 +2,98 @@
 Invoice Processing Agent Nodes
 Each node represents a stage in the workflow
 """
-from typing import Dict, Any
-from datetime import datetime
+from typing import Dict, Any, Hashable, List, Optional
+from datetime import datetime, timezone
+import asyncio
+import functools
 import uuid
+import time
+import re
 import logging
 
 from ..state import InvoiceProcessingState
 from ..tools.bigtool import bigtool
-from ..mcp.client import mcp_client
-from ..tools.checkpoint_db import checkpoint_db
+from ..mcp.batching import mcp_dispatcher
+from ..tools.checkpoint_db import checkpoint_db, audit_buffer
+from ..tools.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# PO references embedded in OCR text, e.g. PO-2025-001
+_PO_RE = re.compile(r'PO-\d+-\d+')
+
+# Characters dropped when building vendor lookup keys
+_VENDOR_KEY_RE = re.compile(r'[^a-z0-9]')
+
+# Vendor normalization/enrichment results keyed by vendor, filled from MCP responses
+_vendor_cache = TTLCache(maxsize=10000, ttl=3600)
+_enrichment_cache = TTLCache(maxsize=10000, ttl=3600)
+
+
+@functools.lru_cache(maxsize=10000)
+def _normalize_key(name: str) -> str:
+    """Lowercase alphanumeric lookup key for a vendor name"""
+    return _VENDOR_KEY_RE.sub("", name.lower())
+
+
+# ERP retrieval results, reused while a vendor's invoices arrive back-to-back
+_po_cache = TTLCache(maxsize=1024, ttl=300)
+_grn_cache = TTLCache(maxsize=1024, ttl=300)
+_history_cache = TTLCache(maxsize=1024, ttl=300)
+
+# State needed to show a paused invoice for review and resume it
+# (invoice_text, parsed items etc. stay in the raw store written at intake)
+_CHECKPOINT_FIELDS = (
+    "workflow_id",
+    "invoice_payload",
+    "vendor_profile",
+    "matched_pos",
+    "matched_grns",
+    "po_amount",
+    "match_score",
+    "match_result",
+    "tolerance_pct",
+    "current_stage",
+    "bigtool_selections"
+)
+
+# Last formatted UTC timestamp, reused within a 1 ms window
+_last_ts = (0.0, "")
+
+
+def _now_iso() -> str:
+    """Current UTC time in ISO format, cached for audit entries"""
+    global _last_ts
+    t = time.time()
+    if t - _last_ts[0] > 0.001:
+        _last_ts = (t, datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None).isoformat())
+    return _last_ts[1]
+
+
+async def _execute_ability(ability_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Execute an MCP ability, batched with concurrent calls to the same ability
+    (the dispatcher applies the shared concurrency/rate limits per batch)
+    """
+    return await mcp_dispatcher.execute_ability(ability_name, parameters)
+
+
+async def _fetch_cached(
+    cache: TTLCache,
+    key: Hashable,
+    ability_name: str,
+    parameters: Dict[str, Any],
+    result_key: str
+) -> List[Dict[str, Any]]:
+    """Fetch ERP records via MCP, reusing a recent successful result for the same key"""
+    records = cache.get(key)
+    if records is None:
+        result = await _execute_ability(ability_name, parameters)
+        records = result.get(result_key, [])
+        if result.get("success"):
+            cache.set(key, records)
+    return records
+
 
 class InvoiceProcessingAgents:
     """
@@ -24,6 +104,31 @@ class InvoiceProcessingAgents:
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.match_threshold = config.get("match_threshold", 0.90)
+        
+        # Tool selection criteria are fixed per stage, so select once up front
+        self._tools = {
+            "storage_speed": bigtool.select("storage", {"priority": "speed"}),
+            "ocr_accuracy": bigtool.select("ocr", {"priority": "accuracy"}),
+            "enrichment_accuracy": bigtool.select("enrichment", {"priority": "accuracy"}),
+            "erp_speed": bigtool.select("erp_connector", {"priority": "speed"}),
+            "db_speed": bigtool.select("db", {"priority": "speed"}),
+            "email_speed": bigtool.select("email", {"priority": "speed"})
+        }
+    
+    @staticmethod
+    def _audit_entry(
+        stage: str,
+        action: str,
+        timestamp: Optional[str] = None,
+        **details: Any
+    ) -> Dict[str, Any]:
+        """Build an audit_log state entry for a stage"""
+        return {
+            "stage": stage,
+            "action": action,
+            "timestamp": timestamp or _now_iso(),
+            "details": details
+        }
     
     async def intake_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
         """
@@ -37,26 +142,26 @@ class InvoiceProcessingAgents:
         workflow_id = str(uuid.uuid4())
         
         # Select storage tool via Bigtool
-        storage_tool = bigtool.select("storage", {"priority": "speed"})
+        storage_tool = self._tools["storage_speed"]
         logger.info(f"🔧 Bigtool selected storage: {storage_tool['name']}")
         
-        # Validate schema via MCP COMMON
-        validation_result = await mcp_client.execute_ability(
-            "validate_schema",
-            {"payload": invoice_payload}
-        )
-        
-        # Persist raw invoice via MCP COMMON
-        persist_result = await mcp_client.execute_ability(
-            "persist_raw_invoice",
-            {"invoice_id": invoice_payload.get("invoice_id"), "payload": invoice_payload}
+        # Validate schema and persist raw invoice via MCP COMMON (independent)
+        validation_result, persist_result = await asyncio.gather(
+            _execute_ability(
+                "validate_schema",
+                {"payload": invoice_payload}
+            ),
+            _execute_ability(
+                "persist_raw_invoice",
+                {"invoice_id": invoice_payload.get("invoice_id"), "payload": invoice_payload}
+            )
         )
         
         raw_id = persist_result.get("raw_id", f"RAW_{workflow_id}")
-        ingest_ts = persist_result.get("stored_at", datetime.utcnow().isoformat())
+        ingest_ts = persist_result.get("stored_at", _now_iso())
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             workflow_id,
             "INTAKE",
             "invoice_ingested",
@@ -74,12 +179,12 @@ class InvoiceProcessingAgents:
             "bigtool_selections": {
                 "INTAKE_storage": storage_tool["name"]
             },
-            "audit_log": [{
-                "stage": "INTAKE",
-                "action": "invoice_ingested",
-                "timestamp": ingest_ts,
-                "details": {"raw_id": raw_id}
-            }]
+            "audit_log": (self._audit_entry(
+                "INTAKE",
+                "invoice_ingested",
+                timestamp=ingest_ts,
+                raw_id=raw_id
+            ),)
         }
     
     async def understand_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -93,11 +198,11 @@ class InvoiceProcessingAgents:
         invoice_payload = state["invoice_payload"]
         
         # Select OCR tool via Bigtool
-        ocr_tool = bigtool.select("ocr", {"priority": "accuracy"})
+        ocr_tool = self._tools["ocr_accuracy"]
         logger.info(f"🔧 Bigtool selected OCR: {ocr_tool['name']}")
         
         # Run OCR via MCP ATLAS
-        ocr_result = await mcp_client.execute_ability(
+        ocr_result = await _execute_ability(
             "ocr_extract",
             {"attachments": invoice_payload.get("attachments", [])}
         )
@@ -105,7 +210,7 @@ class InvoiceProcessingAgents:
         invoice_text = ocr_result.get("extracted_text", "")
         
         # Parse line items via MCP COMMON
-        parse_result = await mcp_client.execute_ability(
+        parse_result = await _execute_ability(
             "parse_line_items",
             {"line_items": invoice_payload.get("line_items", []), "text": invoice_text}
         )
@@ -113,11 +218,7 @@ class InvoiceProcessingAgents:
         parsed_line_items = parse_result.get("parsed_items", [])
         
         # Extract PO references from text
-        detected_pos = []
-        if "PO-" in invoice_text:
-            import re
-            pos = re.findall(r'PO-\d+-\d+', invoice_text)
-            detected_pos = pos
+        detected_pos = _PO_RE.findall(invoice_text)
         
         parsed_invoice = {
             "invoice_text": invoice_text,
@@ -131,7 +232,7 @@ class InvoiceProcessingAgents:
         }
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "UNDERSTAND",
             "ocr_and_parsing_completed",
@@ -150,12 +251,11 @@ class InvoiceProcessingAgents:
             "bigtool_selections": {
                 "UNDERSTAND_ocr": ocr_tool["name"]
             },
-            "audit_log": [{
-                "stage": "UNDERSTAND",
-                "action": "ocr_completed",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"items_parsed": len(parsed_line_items)}
-            }]
+            "audit_log": (self._audit_entry(
+                "UNDERSTAND",
+                "ocr_completed",
+                items_parsed=len(parsed_line_items)
+            ),)
         }
     
     async def prepare_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -169,25 +269,33 @@ class InvoiceProcessingAgents:
         invoice_payload = state["invoice_payload"]
         vendor_name = invoice_payload.get("vendor_name", "")
         
-        # Normalize vendor via MCP COMMON
-        normalize_result = await mcp_client.execute_ability(
-            "normalize_vendor",
-            {"vendor_name": vendor_name}
-        )
-        
-        normalized_name = normalize_result.get("normalized_name", vendor_name)
+        # Normalize vendor via MCP COMMON (recurring vendors are served from cache)
+        vendor_key = _normalize_key(vendor_name)
+        normalized_name = _vendor_cache.get(vendor_key)
+        if normalized_name is None:
+            normalize_result = await _execute_ability(
+                "normalize_vendor",
+                {"vendor_name": vendor_name}
+            )
+            normalized_name = normalize_result.get("normalized_name", vendor_name)
+            if normalize_result.get("success"):
+                _vendor_cache.set(vendor_key, normalized_name)
         
         # Select enrichment tool via Bigtool
-        enrichment_tool = bigtool.select("enrichment", {"priority": "accuracy"})
+        enrichment_tool = self._tools["enrichment_accuracy"]
         logger.info(f"🔧 Bigtool selected enrichment: {enrichment_tool['name']}")
         
         # Enrich vendor via MCP ATLAS
-        enrich_result = await mcp_client.execute_ability(
-            "enrich_vendor",
-            {"vendor_name": normalized_name, "tax_id": invoice_payload.get("vendor_tax_id")}
-        )
-        
-        enrichment_data = enrich_result.get("enrichment_data", {})
+        enrich_key = (normalized_name, invoice_payload.get("vendor_tax_id"))
+        enrichment_data = _enrichment_cache.get(enrich_key)
+        if enrichment_data is None:
+            enrich_result = await _execute_ability(
+                "enrich_vendor",
+                {"vendor_name": normalized_name, "tax_id": invoice_payload.get("vendor_tax_id")}
+            )
+            enrichment_data = enrich_result.get("enrichment_data", {})
+            if enrich_result.get("success"):
+                _enrichment_cache.set(enrich_key, enrichment_data)
         
         vendor_profile = {
             "normalized_name": normalized_name,
@@ -196,7 +304,7 @@ class InvoiceProcessingAgents:
         }
         
         # Compute flags via MCP COMMON
-        flags_result = await mcp_client.execute_ability(
+        flags_result = await _execute_ability(
             "compute_flags",
             {"vendor_profile": vendor_profile, "invoice": invoice_payload}
         )
@@ -210,7 +318,7 @@ class InvoiceProcessingAgents:
         }
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "PREPARE",
             "vendor_enriched",
@@ -231,12 +339,11 @@ class InvoiceProcessingAgents:
             "bigtool_selections": {
                 "PREPARE_enrichment": enrichment_tool["name"]
             },
-            "audit_log": [{
-                "stage": "PREPARE",
-                "action": "vendor_enriched",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"normalized_name": normalized_name}
-            }]
+            "audit_log": (self._audit_entry(
+                "PREPARE",
+                "vendor_enriched",
+                normalized_name=normalized_name
+            ),)
         }
     
     async def retrieve_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -247,39 +354,34 @@ class InvoiceProcessingAgents:
         logger.info("STAGE: RETRIEVE - Fetching ERP data")
         logger.info("=" * 60)
         
-        vendor_profile = state.get("vendor_profile", {})
+        vendor_profile = state.get("vendor_profile") or {}
         vendor_name = vendor_profile.get("normalized_name", "")
         
         # Select ERP connector via Bigtool
-        erp_tool = bigtool.select("erp_connector", {"priority": "speed"})
+        erp_tool = self._tools["erp_speed"]
         logger.info(f"🔧 Bigtool selected ERP: {erp_tool['name']}")
         
-        # Fetch PO via MCP ATLAS
-        po_result = await mcp_client.execute_ability(
-            "fetch_po",
-            {"vendor_name": vendor_name}
-        )
-        
-        matched_pos = po_result.get("purchase_orders", [])
-        
-        # Fetch GRN via MCP ATLAS
-        grn_result = await mcp_client.execute_ability(
-            "fetch_grn",
-            {"vendor_name": vendor_name, "pos": matched_pos}
+        # Fetch PO and history via MCP ATLAS (independent, cached per vendor)
+        matched_pos, history = await asyncio.gather(
+            _fetch_cached(
+                _po_cache, vendor_name, "fetch_po",
+                {"vendor_name": vendor_name}, "purchase_orders"
+            ),
+            _fetch_cached(
+                _history_cache, vendor_name, "fetch_history",
+                {"vendor_name": vendor_name}, "historical_invoices"
+            )
         )
         
-        matched_grns = grn_result.get("goods_received_notes", [])
-        
-        # Fetch history via MCP ATLAS
-        history_result = await mcp_client.execute_ability(
-            "fetch_history",
-            {"vendor_name": vendor_name}
+        # Fetch GRN via MCP ATLAS (needs the matched POs)
+        grn_key = (vendor_name, tuple(sorted(po.get("po_number", "") for po in matched_pos)))
+        matched_grns = await _fetch_cached(
+            _grn_cache, grn_key, "fetch_grn",
+            {"vendor_name": vendor_name, "pos": matched_pos}, "goods_received_notes"
         )
         
-        history = history_result.get("historical_invoices", [])
-        
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "RETRIEVE",
             "erp_data_fetched",
@@ -300,12 +402,11 @@ class InvoiceProcessingAgents:
             "bigtool_selections": {
                 "RETRIEVE_erp": erp_tool["name"]
             },
-            "audit_log": [{
-                "stage": "RETRIEVE",
-                "action": "erp_data_fetched",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"pos_found": len(matched_pos)}
-            }]
+            "audit_log": (self._audit_entry(
+                "RETRIEVE",
+                "erp_data_fetched",
+                pos_found=len(matched_pos)
+            ),)
         }
     
     async def match_two_way_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -322,23 +423,30 @@ class InvoiceProcessingAgents:
         invoice_amount = invoice_payload.get("amount", 0)
         po_amount = matched_pos[0].get("amount", 0) if matched_pos else 0
         
-        # Compute match score via MCP COMMON
-        match_result = await mcp_client.execute_ability(
-            "compute_match_score",
-            {
-                "invoice_amount": invoice_amount,
-                "po_amount": po_amount,
-                "threshold": self.match_threshold
-            }
-        )
-        
-        match_score = match_result.get("match_score", 0.0)
-        match_status = match_result.get("match_result", "FAILED")
-        tolerance_pct = match_result.get("tolerance_pct", 0)
-        match_evidence = match_result.get("match_evidence", {})
+        if not matched_pos:
+            # Nothing to match against - fail locally without an MCP round-trip
+            match_score = 0.0
+            match_status = "FAILED"
+            tolerance_pct = 100
+            match_evidence = {"reason": "no_po", "invoice_amount": invoice_amount}
+        else:
+            # Compute match score via MCP COMMON
+            match_result = await _execute_ability(
+                "compute_match_score",
+                {
+                    "invoice_amount": invoice_amount,
+                    "po_amount": po_amount,
+                    "threshold": self.match_threshold
+                }
+            )
+            
+            match_score = match_result.get("match_score", 0.0)
+            match_status = match_result.get("match_result", "FAILED")
+            tolerance_pct = match_result.get("tolerance_pct", 0)
+            match_evidence = match_result.get("match_evidence", {})
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "MATCH_TWO_WAY",
             "matching_completed",
@@ -352,17 +460,18 @@ class InvoiceProcessingAgents:
         logger.info(f"✅ Match score: {match_score:.2f} - {match_status}")
         
         return {
+            "po_amount": po_amount,
             "match_score": match_score,
             "match_result": match_status,
             "tolerance_pct": tolerance_pct,
             "match_evidence": match_evidence,
             "current_stage": "CHECKPOINT_HITL" if match_status == "FAILED" else "RECONCILE",
-            "audit_log": [{
-                "stage": "MATCH_TWO_WAY",
-                "action": "matching_completed",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"match_score": match_score, "match_result": match_status}
-            }]
+            "audit_log": (self._audit_entry(
+                "MATCH_TWO_WAY",
+                "matching_completed",
+                match_score=match_score,
+                match_result=match_status
+            ),)
         }
     
     async def checkpoint_hitl_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -387,27 +496,35 @@ class InvoiceProcessingAgents:
         invoice_payload = state["invoice_payload"]
         
         # Select DB tool via Bigtool
-        db_tool = bigtool.select("db", {"priority": "speed"})
+        db_tool = self._tools["db_speed"]
         logger.info(f"🔧 Bigtool selected DB: {db_tool['name']}")
         
-        # Create checkpoint in database
-        checkpoint_db.create_checkpoint(
+        checkpoint_entry = self._audit_entry(
+            "CHECKPOINT_HITL",
+            "checkpoint_created",
+            checkpoint_id=checkpoint_id
+        )
+        selections = {"CHECKPOINT_db": db_tool["name"]}
+        saved_state = {k: state[k] for k in _CHECKPOINT_FIELDS if k in state}
+        # Include this stage's audit entry and tool selection (the graph only
+        # merges them after the node returns)
+        saved_state["audit_log"] = (*state.get("audit_log", ()), checkpoint_entry)
+        saved_state["bigtool_selections"] = {**state.get("bigtool_selections", {}), **selections}
+        
+        # Create checkpoint and add to human review queue (batched with
+        # checkpoints from concurrently running workflows)
+        review_url = await checkpoint_db.enqueue_pending(
             checkpoint_id=checkpoint_id,
             workflow_id=workflow_id,
             invoice_id=invoice_payload.get("invoice_id"),
-            state=dict(state),
-            paused_reason="Two-way matching failed - requires human review"
-        )
-        
-        # Add to human review queue
-        review_url = checkpoint_db.add_to_review_queue(
-            checkpoint_id=checkpoint_id,
+            state=saved_state,
+            paused_reason="Two-way matching failed - requires human review",
             invoice_data=invoice_payload,
             reason=f"Match score {state.get('match_score', 0):.2f} below threshold {self.match_threshold}"
         )
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             workflow_id,
             "CHECKPOINT_HITL",
             "checkpoint_created",
@@ -416,6 +533,8 @@ class InvoiceProcessingAgents:
                 "reason": "matching_failed"
             }
         )
+        # The workflow pauses here, so persist its audit trail for reviewers
+        await audit_buffer.flush_async()
         
         logger.info(f"⏸️  Checkpoint created: {checkpoint_id}")
         logger.info(f"🔗 Review URL: {review_url}")
@@ -424,87 +543,30 @@ class InvoiceProcessingAgents:
             "checkpoint_ref": checkpoint_id,
             "review_url": review_url,
             "paused_reason": "Two-way matching failed - requires human review",
+            "status": "PAUSED",
             "current_stage": "HITL_DECISION",
-            "bigtool_selections": {
-                "CHECKPOINT_db": db_tool["name"]
-            },
-            "audit_log": [{
-                "stage": "CHECKPOINT_HITL",
-                "action": "checkpoint_created",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"checkpoint_id": checkpoint_id}
-            }]
+            "bigtool_selections": selections,
+            "audit_log": (checkpoint_entry,)
         }
     
     async def hitl_decision_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
         """
-        HITL_DECISION Stage: Process human decision
+        HITL_DECISION Stage: Apply the human decision
+        
+        The graph interrupts before this node; decisions arrive through the
+        review API and resume_from_checkpoint continues the workflow.
         """
         logger.info("=" * 60)
-        logger.info("STAGE: HITL_DECISION - Awaiting human decision")
+        logger.info("STAGE: HITL_DECISION - Applying human decision")
         logger.info("=" * 60)
         
-        checkpoint_id = state.get("checkpoint_ref")
-
-        if not checkpoint_id:
-            logger.warning("No checkpoint_ref found, skipping HITL decision")
-            return {"current_stage": "RECONCILE"}
-        
-        # In a real implementation, this would wait for human input
-        # For demo purposes, we'll simulate an ACCEPT decision
-        logger.info("⏳ Waiting for human decision...")
-        logger.info("(In demo mode, automatically accepting after brief pause)")
-        
-        # Simulate human decision
-        import asyncio
-        await asyncio.sleep(1)
-        
-        human_decision = "ACCEPT"  # Could be "ACCEPT" or "REJECT"
-        reviewer_id = "demo_reviewer_001"
-        
-        # Record decision in database
-        checkpoint_db.record_decision(
-            checkpoint_id=checkpoint_id,
-            decision=human_decision,
-            reviewer_id=reviewer_id,
-            notes="Demo auto-accept for testing"
-        )
-        
-        # Add audit log
-        checkpoint_db.add_audit_log(
-            state.get("workflow_id"),
-            "HITL_DECISION",
-            "decision_recorded",
-            {
-                "checkpoint_id": checkpoint_id,
-                "decision": human_decision,
-                "reviewer_id": reviewer_id
-            }
-        )
-        
-        logger.info(f"✅ Human decision: {human_decision} by {reviewer_id}")
-        
-        if human_decision == "REJECT":
+        if state.get("human_decision") == "REJECT":
             return {
-                "human_decision": human_decision,
-                "reviewer_id": reviewer_id,
                 "status": "MANUAL_HANDOFF",
                 "current_stage": "COMPLETE"
             }
         
-        return {
-            "human_decision": human_decision,
-            "reviewer_id": reviewer_id,
-            "resume_token": f"RESUME_{checkpoint_id}",
-            "next_stage": "RECONCILE",
-            "current_stage": "RECONCILE",
-            "audit_log": [{
-                "stage": "HITL_DECISION",
-                "action": "decision_recorded",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"decision": human_decision}
-            }]
-        }
+        return {"current_stage": "RECONCILE"}
     
     async def reconcile_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
         """
@@ -516,13 +578,15 @@ class InvoiceProcessingAgents:
         
         invoice_payload = state["invoice_payload"]
         amount = invoice_payload.get("amount", 0)
+        vendor_profile = state.get("vendor_profile") or {}
+        normalized_name = vendor_profile.get("normalized_name", "")
         
         # Build accounting entries via MCP COMMON
-        accounting_result = await mcp_client.execute_ability(
+        accounting_result = await _execute_ability(
             "build_accounting_entries",
             {
                 "amount": amount,
-                "vendor": state.get("vendor_profile", {}).get("normalized_name", ""),
+                "vendor": normalized_name,
                 "invoice_id": invoice_payload.get("invoice_id")
             }
         )
@@ -531,13 +595,13 @@ class InvoiceProcessingAgents:
         
         reconciliation_report = {
             "invoice_amount": amount,
-            "po_amount": state.get("matched_pos", [{}])[0].get("amount", 0) if state.get("matched_pos") else 0,
+            "po_amount": state.get("po_amount") or 0,
             "difference": 0,
             "reconciled": True
         }
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "RECONCILE",
             "accounting_entries_created",
@@ -550,12 +614,11 @@ class InvoiceProcessingAgents:
             "accounting_entries": accounting_entries,
             "reconciliation_report": reconciliation_report,
             "current_stage": "APPROVE",
-            "audit_log": [{
-                "stage": "RECONCILE",
-                "action": "accounting_entries_created",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"entries_count": len(accounting_entries)}
-            }]
+            "audit_log": (self._audit_entry(
+                "RECONCILE",
+                "accounting_entries_created",
+                entries_count=len(accounting_entries)
+            ),)
         }
     
     async def approve_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -568,13 +631,15 @@ class InvoiceProcessingAgents:
         
         invoice_payload = state["invoice_payload"]
         amount = invoice_payload.get("amount", 0)
+        vendor_profile = state.get("vendor_profile") or {}
+        normalized_name = vendor_profile.get("normalized_name", "")
         
         # Apply approval policy via MCP ATLAS
-        approval_result = await mcp_client.execute_ability(
+        approval_result = await _execute_ability(
             "apply_approval_policy",
             {
                 "amount": amount,
-                "vendor": state.get("vendor_profile", {}).get("normalized_name", "")
+                "vendor": normalized_name
             }
         )
         
@@ -582,7 +647,7 @@ class InvoiceProcessingAgents:
         approver_id = approval_result.get("approver_id", "system")
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "APPROVE",
             "approval_applied",
@@ -595,12 +660,11 @@ class InvoiceProcessingAgents:
             "approval_status": approval_status,
             "approver_id": approver_id,
             "current_stage": "POSTING",
-            "audit_log": [{
-                "stage": "APPROVE",
-                "action": "approval_applied",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"approval_status": approval_status}
-            }]
+            "audit_log": (self._audit_entry(
+                "APPROVE",
+                "approval_applied",
+                approval_status=approval_status
+            ),)
         }
     
     async def posting_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -614,35 +678,35 @@ class InvoiceProcessingAgents:
         invoice_payload = state["invoice_payload"]
         
         # Select ERP connector via Bigtool
-        erp_tool = bigtool.select("erp_connector", {"priority": "speed"})
+        erp_tool = self._tools["erp_speed"]
         logger.info(f"🔧 Bigtool selected ERP: {erp_tool['name']}")
         
-        # Post to ERP via MCP ATLAS
-        post_result = await mcp_client.execute_ability(
-            "post_to_erp",
-            {
-                "invoice_id": invoice_payload.get("invoice_id"),
-                "accounting_entries": state.get("accounting_entries", [])
-            }
+        # Post to ERP and schedule payment via MCP ATLAS (independent)
+        post_result, payment_result = await asyncio.gather(
+            _execute_ability(
+                "post_to_erp",
+                {
+                    "invoice_id": invoice_payload.get("invoice_id"),
+                    "accounting_entries": state.get("accounting_entries", [])
+                }
+            ),
+            _execute_ability(
+                "schedule_payment",
+                {
+                    "invoice_id": invoice_payload.get("invoice_id"),
+                    "amount": invoice_payload.get("amount"),
+                    "due_date": invoice_payload.get("due_date")
+                }
+            )
         )
         
         erp_txn_id = post_result.get("erp_txn_id", "")
         posted = post_result.get("posted", True)
         
-        # Schedule payment via MCP ATLAS
-        payment_result = await mcp_client.execute_ability(
-            "schedule_payment",
-            {
-                "invoice_id": invoice_payload.get("invoice_id"),
-                "amount": invoice_payload.get("amount"),
-                "due_date": invoice_payload.get("due_date")
-            }
-        )
-        
         scheduled_payment_id = payment_result.get("scheduled_payment_id", "")
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "POSTING",
             "posted_to_erp",
@@ -659,12 +723,7 @@ class InvoiceProcessingAgents:
             "bigtool_selections": {
                 "POSTING_erp": erp_tool["name"]
             },
-            "audit_log": [{
-                "stage": "POSTING",
-                "action": "posted_to_erp",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"erp_txn_id": erp_txn_id}
-            }]
+            "audit_log": (self._audit_entry("POSTING", "posted_to_erp", erp_txn_id=erp_txn_id),)
         }
     
     async def notify_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
@@ -678,11 +737,11 @@ class InvoiceProcessingAgents:
         invoice_payload = state["invoice_payload"]
         
         # Select email tool via Bigtool
-        email_tool = bigtool.select("email", {"priority": "speed"})
+        email_tool = self._tools["email_speed"]
         logger.info(f"🔧 Bigtool selected email: {email_tool['name']}")
         
         # Send notifications via MCP ATLAS
-        notify_result = await mcp_client.execute_ability(
+        notify_result = await _execute_ability(
             "send_notification",
             {
                 "invoice_id": invoice_payload.get("invoice_id"),
@@ -700,7 +759,7 @@ class InvoiceProcessingAgents:
         }
         
         # Add audit log
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             state.get("workflow_id"),
             "NOTIFY",
             "notifications_sent",
@@ -716,49 +775,58 @@ class InvoiceProcessingAgents:
             "bigtool_selections": {
                 "NOTIFY_email": email_tool["name"]
             },
-            "audit_log": [{
-                "stage": "NOTIFY",
-                "action": "notifications_sent",
-                "timestamp": datetime.utcnow().isoformat(),
-                "details": {"parties_notified": len(notified_parties)}
-            }]
+            "audit_log": (self._audit_entry(
+                "NOTIFY",
+                "notifications_sent",
+                parties_notified=len(notified_parties)
+            ),)
         }
     
     async def complete_node(self, state: InvoiceProcessingState) -> Dict[str, Any]:
         """
         COMPLETE Stage: Finalize workflow
         """
+        result = self.complete_sync(state)
+        
+        # The workflow ends here, so persist its audit trail
+        await audit_buffer.flush_async()
+        return result
+    
+    def complete_sync(self, state: InvoiceProcessingState) -> Dict[str, Any]:
+        """
+        COMPLETE Stage without flushing the audit buffer: builds the final
+        payload and records completion. Used directly on REJECT resume.
+        """
         logger.info("=" * 60)
         logger.info("STAGE: COMPLETE - Finalizing workflow")
         logger.info("=" * 60)
         
         workflow_id = state.get("workflow_id")
         invoice_payload = state["invoice_payload"]
+        vendor_profile = state.get("vendor_profile") or {}
+        normalized_name = vendor_profile.get("normalized_name", "")
         
         # Select DB tool via Bigtool
-        db_tool = bigtool.select("db", {"priority": "speed"})
+        db_tool = self._tools["db_speed"]
         logger.info(f"🔧 Bigtool selected DB: {db_tool['name']}")
         
-        # Get full audit log from database
-        audit_log = checkpoint_db.get_audit_log(workflow_id)
-        
         # Build final payload
         final_payload = {
             "workflow_id": workflow_id,
             "invoice_id": invoice_payload.get("invoice_id"),
             "status": state.get("status", "COMPLETED"),
-            "vendor": state.get("vendor_profile", {}).get("normalized_name", ""),
+            "vendor": normalized_name,
             "amount": invoice_payload.get("amount"),
             "currency": invoice_payload.get("currency"),
             "match_score": state.get("match_score"),
             "approval_status": state.get("approval_status"),
             "erp_txn_id": state.get("erp_txn_id"),
             "payment_id": state.get("scheduled_payment_id"),
-            "completed_at": datetime.utcnow().isoformat()
+            "completed_at": _now_iso()
         }
         
         # Add final audit entry
-        checkpoint_db.add_audit_log(
+        audit_buffer.append(
             workflow_id,
             "COMPLETE",
             "workflow_completed",
@@ -775,10 +843,14 @@ class InvoiceProcessingAgents:
         
         return {
             "final_payload": final_payload,
-            "audit_log": audit_log,
             "status": "COMPLETED",
             "current_stage": "COMPLETE",
             "bigtool_selections": {
                 "COMPLETE_db": db_tool["name"]
-            }
+            },
+            "audit_log": (self._audit_entry(
+                "COMPLETE",
+                "workflow_completed",
+                final_status=final_payload["status"]
+            ),)
         }
@@ -2,17 +2,24 @@
 FastAPI Backend for Invoice Processing Workflow
 Provides REST API for triggering workflows and human review
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Dict, Any, List, Optional
 import logging
 import asyncio
-from datetime import datetime
+import os
+import time
+import orjson
+import msgspec
 
-from src.workflow import InvoiceProcessingWorkflow
-from src.tools.checkpoint_db import checkpoint_db
+from src.workflow import CheckpointNotFoundError, CheckpointResolvedError, get_default_workflow
+from src.tools.checkpoint_db import checkpoint_db, audit_buffer
 from src.tools.bigtool import bigtool
+from src.mcp.client import mcp_client
+from src.tools.ttl_cache import TTLCache
 
 # Configure logging
 logging.basicConfig(
@@ -21,11 +28,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class ORJSONResponse(Response):
+    """
+    JSON response rendered with orjson (FastAPI's own ORJSONResponse is
+    deprecated); route return values are already made JSON-compatible by FastAPI
+    """
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Invoice Processing Workflow API",
     description="LangGraph-based invoice processing with HITL",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -40,18 +60,98 @@ app.add_middleware(
 # Initialize workflow
 workflow = None
 
+# /process-invoice batching: max requests per batch and how long to wait for one to fill
+BATCH_MAX = int(os.getenv("BATCH_MAX", "16"))
+MAX_WAIT_MS = int(os.getenv("MAX_WAIT_MS", "50"))
+
+# Batches currently running (held so their tasks are not garbage collected)
+_running_batches = set()
+
+# Checkpoint details for /human-review/{checkpoint_id}, which review UIs poll.
+# A short TTL keeps polling off the database without letting pauses go stale.
+_review_cache = TTLCache(maxsize=256, ttl=2.0)
+
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize workflow on startup"""
     global workflow
-    workflow = InvoiceProcessingWorkflow("config/workflow.json")
+    workflow = get_default_workflow("config/workflow.json")
+    await mcp_client.open_session()
+    app.state.queue = asyncio.Queue()
+    app.state.dispatcher = asyncio.create_task(_batch_dispatcher(app.state.queue))
+    # The graph is fixed once built, so render its visualization once
+    app.state.graph_viz = workflow.get_graph_visualization()
     logger.info("🚀 Invoice Processing Workflow API started")
-    logger.info(workflow.get_graph_visualization())
+    logger.info(app.state.graph_viz)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the batch dispatcher and release pooled MCP connections"""
+    app.state.dispatcher.cancel()
+    await asyncio.gather(app.state.dispatcher, return_exceptions=True)
+    
+    # Fail requests still waiting for a batch so their callers get a response
+    queue = app.state.queue
+    _reject_requests([queue.get_nowait() for _ in range(queue.qsize())])
+    
+    # Let running batches finish before their MCP connections are closed
+    await asyncio.gather(*_running_batches, return_exceptions=True)
+    await mcp_client.close_session()
+
+
+def _reject_requests(batch: List[tuple]):
+    """Fail queued /process-invoice requests with a 503 during shutdown"""
+    for _, _, future in batch:
+        if not future.done():
+            future.set_exception(HTTPException(status_code=503, detail="Server is shutting down"))
+
+
+async def _batch_dispatcher(queue: asyncio.Queue):
+    """
+    Drain queued /process-invoice requests into batches of up to BATCH_MAX,
+    waiting at most MAX_WAIT_MS for a batch to fill
+    """
+    batch = []
+    try:
+        while True:
+            batch = [await queue.get()]
+            if queue.qsize() < BATCH_MAX - 1:
+                await asyncio.sleep(MAX_WAIT_MS / 1000)
+            while len(batch) < BATCH_MAX and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            # Run the batch without holding up the next one
+            task = asyncio.create_task(_run_batch(batch))
+            _running_batches.add(task)
+            task.add_done_callback(_running_batches.discard)
+            batch = []
+    except asyncio.CancelledError:
+        # Requests taken off the queue but not yet running
+        _reject_requests(batch)
+        raise
+
+
+async def _run_batch(batch: List[tuple]):
+    """Run a batch of workflows concurrently and resolve each request's future"""
+    results = await asyncio.gather(
+        *[workflow.run(invoice_payload=payload, thread_id=thread_id) for payload, thread_id, _ in batch],
+        return_exceptions=True
+    )
+    for (_, _, future), result in zip(batch, results):
+        if future.done():
+            continue
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
 
 
 # Request/Response Models
 class LineItemModel(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     desc: str
     qty: float
     unit_price: float
@@ -59,6 +159,8 @@ class LineItemModel(BaseModel):
 
 
 class InvoicePayloadModel(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     invoice_id: str
     vendor_name: str
     vendor_tax_id: str
@@ -71,10 +173,41 @@ class InvoicePayloadModel(BaseModel):
 
 
 class ProcessInvoiceRequest(BaseModel):
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     invoice_payload: InvoicePayloadModel
     thread_id: Optional[str] = "default"
 
 
+# msgspec mirrors of the request models for /process-invoice-fast.
+# Validation is strict (types checked, unknown fields rejected) but non-pydantic.
+class LineItemStruct(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
+    desc: str
+    qty: float
+    unit_price: float
+    total: float
+
+
+class InvoicePayloadStruct(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
+    invoice_id: str
+    vendor_name: str
+    vendor_tax_id: str
+    invoice_date: str
+    due_date: str
+    amount: float
+    currency: str
+    line_items: List[LineItemStruct]
+    attachments: List[str]
+
+
+class ProcessInvoiceRequestStruct(msgspec.Struct, frozen=True, forbid_unknown_fields=True):
+    invoice_payload: InvoicePayloadStruct
+    thread_id: Optional[str] = "default"
+
+
+_process_invoice_decoder = msgspec.json.Decoder(ProcessInvoiceRequestStruct)
+
+
 class HumanDecisionRequest(BaseModel):
     checkpoint_id: str
     decision: str  # "ACCEPT" or "REJECT"
@@ -123,34 +256,70 @@ async def process_invoice(request: ProcessInvoiceRequest):
     12. COMPLETE - Finalize
     """
     try:
-        logger.info(f"Received invoice processing request: {request.invoice_payload.invoice_id}")
+        logger.info("Received invoice processing request: %s", request.invoice_payload.invoice_id)
         
         # Convert Pydantic model to dict
-        invoice_payload = request.invoice_payload.dict()
+        invoice_payload = request.invoice_payload.model_dump(mode="python")
         
-        # Run workflow
-        final_state = await workflow.run(
-            invoice_payload=invoice_payload,
-            thread_id=request.thread_id
-        )
+        return await _submit_invoice(invoice_payload, request.thread_id)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error processing invoice: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/process-invoice-fast")
+async def process_invoice_fast(request: Request):
+    """
+    Process an invoice for trusted internal callers
+    
+    Same workflow as /process-invoice, but the body is decoded and validated
+    with msgspec instead of pydantic. Validation is still strict: field types
+    are checked and unknown fields are rejected.
+    """
+    try:
+        body = _process_invoice_decoder.decode(await request.body())
+    except msgspec.ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        logger.info("Received invoice processing request: %s", body.invoice_payload.invoice_id)
         
-        return {
-            "success": True,
-            "message": "Invoice processed successfully",
-            "workflow_id": final_state.get("workflow_id"),
-            "invoice_id": invoice_payload["invoice_id"],
-            "status": final_state.get("status"),
-            "final_payload": final_state.get("final_payload"),
-            "bigtool_selections": final_state.get("bigtool_selections", {}),
-            "checkpoint_id": final_state.get("checkpoint_ref"),
-            "review_url": final_state.get("review_url")
-        }
+        invoice_payload = msgspec.to_builtins(body.invoice_payload)
+        
+        return await _submit_invoice(invoice_payload, body.thread_id)
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error processing invoice: {str(e)}")
+        logger.error("Error processing invoice: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _submit_invoice(invoice_payload: Dict[str, Any], thread_id: Optional[str]) -> Dict[str, Any]:
+    """Queue an invoice for the batch dispatcher and build the response from its final state"""
+    # Run workflow (batched with concurrent submissions)
+    future = asyncio.get_running_loop().create_future()
+    await app.state.queue.put((invoice_payload, thread_id, future))
+    final_state = await future
+    
+    return {
+        "success": True,
+        "message": "Invoice processed successfully",
+        "workflow_id": final_state.get("workflow_id"),
+        "invoice_id": invoice_payload["invoice_id"],
+        "status": final_state.get("status"),
+        "final_payload": final_state.get("final_payload"),
+        "bigtool_selections": final_state.get("bigtool_selections", {}),
+        "checkpoint_id": final_state.get("checkpoint_ref"),
+        "review_url": final_state.get("review_url")
+    }
+
+
 @app.get("/human-review/pending")
 async def get_pending_reviews():
     """
@@ -159,7 +328,7 @@ async def get_pending_reviews():
     Returns a list of invoices that are paused and waiting for human decision
     """
     try:
-        pending = checkpoint_db.get_pending_reviews()
+        pending = await run_in_threadpool(checkpoint_db.get_pending_reviews)
         
         return {
             "success": True,
@@ -168,7 +337,7 @@ async def get_pending_reviews():
         }
     
     except Exception as e:
-        logger.error(f"Error fetching pending reviews: {str(e)}")
+        logger.error("Error fetching pending reviews: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -178,7 +347,7 @@ async def get_human_review_history():
     Get history of human decisions (Accepted/Rejected)
     """
     try:
-        history = checkpoint_db.get_decision_history()
+        history = await run_in_threadpool(checkpoint_db.get_decision_history)
         
         return {
             "success": True,
@@ -186,7 +355,7 @@ async def get_human_review_history():
         }
     
     except Exception as e:
-        logger.error(f"Error fetching review history: {str(e)}")
+        logger.error("Error fetching review history: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -196,7 +365,11 @@ async def get_review_details(checkpoint_id: str):
     Get detailed information about a specific review checkpoint
     """
     try:
-        checkpoint_data = checkpoint_db.get_checkpoint(checkpoint_id)
+        checkpoint_data = _review_cache.get(checkpoint_id)
+        if checkpoint_data is None:
+            checkpoint_data = await run_in_threadpool(checkpoint_db.get_checkpoint, checkpoint_id)
+            if checkpoint_data:
+                _review_cache.set(checkpoint_id, checkpoint_data)
         
         if not checkpoint_data:
             raise HTTPException(status_code=404, detail="Checkpoint not found")
@@ -222,14 +395,14 @@ async def get_review_details(checkpoint_id: str):
                 "match_result": state.get("match_result"),
                 "tolerance_pct": state.get("tolerance_pct"),
                 "invoice_amount": state["invoice_payload"]["amount"],
-                "po_amount": state.get("matched_pos", [{}])[0].get("amount", 0) if state.get("matched_pos") else 0
+                "po_amount": state.get("po_amount") or 0
             }
         }
     
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error fetching review details: {str(e)}")
+        logger.error("Error fetching review details: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -250,8 +423,8 @@ async def submit_human_decision(request: HumanDecisionRequest):
             )
         
         logger.info(
-            f"Received human decision for checkpoint {request.checkpoint_id}: "
-            f"{request.decision} by {request.reviewer_id}"
+            "Received human decision for checkpoint %s: %s by %s",
+            request.checkpoint_id, request.decision, request.reviewer_id
         )
         
         # Resume workflow from checkpoint
@@ -261,6 +434,7 @@ async def submit_human_decision(request: HumanDecisionRequest):
             reviewer_id=request.reviewer_id,
             notes=request.notes
         )
+        _review_cache.invalidate(request.checkpoint_id)
         
         # Determine next stage based on decision
         next_stage = "RECONCILE" if request.decision == "ACCEPT" else "COMPLETE"
@@ -274,14 +448,18 @@ async def submit_human_decision(request: HumanDecisionRequest):
             "final_status": final_state.get("status"),
             "workflow_id": final_state.get("workflow_id"),
             # Spec-compliant fields
-            "resume_token": f"RESUME_{request.checkpoint_id}_{int(datetime.now().timestamp())}",
+            "resume_token": f"RESUME_{request.checkpoint_id}_{int(time.time())}",
             "next_stage": next_stage
         }
     
     except HTTPException:
         raise
+    except CheckpointNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except CheckpointResolvedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        logger.error(f"Error processing human decision: {str(e)}")
+        logger.error("Error processing human decision: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -295,7 +473,7 @@ async def get_workflow_graph():
     """
     return {
         "success": True,
-        "graph": workflow.get_graph_visualization()
+        "graph": app.state.graph_viz
     }
 
 
@@ -309,7 +487,7 @@ async def get_bigtool_history():
     return {
         "success": True,
         "count": len(history),
-        "selections": history
+        "selections": [selection._asdict() for selection in history]
     }
 
 
@@ -319,20 +497,46 @@ async def get_audit_log(workflow_id: str):
     Get the audit log for a specific workflow
     """
     try:
-        audit_log = checkpoint_db.get_audit_log(workflow_id)
-        
-        return {
-            "success": True,
-            "workflow_id": workflow_id,
-            "count": len(audit_log),
-            "audit_log": audit_log
-        }
+        await audit_buffer.flush_async()
     
     except Exception as e:
-        logger.error(f"Error fetching audit log: {str(e)}")
+        logger.error("Error fetching audit log: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+    
+    async def stream():
+        # Entries are streamed chunk by chunk; count is only known at the end
+        yield b'{"success":true,"workflow_id":' + orjson.dumps(workflow_id) + b',"audit_log":['
+        count = 0
+        async for chunk in iterate_in_threadpool(checkpoint_db.iter_audit_log(workflow_id)):
+            for entry in chunk:
+                if count:
+                    yield b","
+                yield orjson.dumps(entry)
+                count += 1
+        yield b'],"count":' + str(count).encode() + b"}"
+    
+    return StreamingResponse(stream(), media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    
+    # Multiple workers need an import string so each process can load the app.
+    # Defaults to one worker: the audit buffer and the review details cache are
+    # per-process, so with more workers /audit can miss rows still buffered in
+    # another worker and review details can be up to the cache TTL stale.
+    workers = int(os.getenv("WORKERS", "1"))
+    uvicorn.run(
+        "src.api.main:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=8000,
+        loop=loop,
+        http="httptools",
+        workers=workers
+    )
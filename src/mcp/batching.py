@@ -0,0 +1,112 @@
+"""
+MCP Batching Dispatcher
+Coalesces near-simultaneous calls to the same ability into one batched round-trip
+"""
+from typing import Dict, Any, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from .client import MCPClient, mcp_client
+from .limits import MCPLimits, mcp_limits
+
+logger = logging.getLogger(__name__)
+
+# Max calls per batched round-trip and how long a batch waits to fill
+MAX_BATCH = 32
+FLUSH_MS = 10
+
+
+class BatchingDispatcher:
+    """
+    Keeps one queue per ability name. A background task per queue drains up
+    to max_batch entries (waiting at most flush_ms for more to arrive) and
+    issues them as a single execute_ability_batch call. The concurrency cap
+    and rate limit apply to those round-trips, not to individual callers
+    waiting for a batch.
+    """
+
+    def __init__(
+        self,
+        client: MCPClient,
+        limits: MCPLimits,
+        max_batch: int = MAX_BATCH,
+        flush_ms: int = FLUSH_MS
+    ):
+        self.client = client
+        self.limits = limits
+        self.max_batch = max_batch
+        self.flush_interval = flush_ms / 1000
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def execute_ability(
+        self,
+        ability_name: str,
+        parameters: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Queue one ability call and wait for its result from the batch"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queues and drain tasks belong to the loop that created them
+            self._queues = {}
+            self._tasks = set()
+            self._loop = loop
+
+        queue = self._queues.get(ability_name)
+        if queue is None:
+            queue = self._queues[ability_name] = asyncio.Queue()
+            self._spawn(self._drain(ability_name, queue))
+
+        future = loop.create_future()
+        queue.put_nowait((parameters, future))
+        return await future
+
+    def _spawn(self, coro) -> asyncio.Task:
+        # Hold a reference so the task is not garbage collected mid-flight
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _drain(self, ability_name: str, queue: asyncio.Queue):
+        """Collect batches from the ability's queue for as long as the loop runs"""
+        while True:
+            batch = [await queue.get()]
+
+            # Give concurrent callers a short window to join this batch
+            if queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.flush_interval)
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            # Dispatch without blocking the next batch from forming
+            self._spawn(self._dispatch(ability_name, batch))
+
+    async def _dispatch(
+        self,
+        ability_name: str,
+        batch: List[Tuple[Dict[str, Any], asyncio.Future]]
+    ):
+        """Send one batched call and resolve each caller's future"""
+        # A failing call comes back as its own error result; an exception
+        # here means the round-trip itself failed, which affects every caller
+        try:
+            results = await self.limits.call_batch(
+                self.client.execute_ability_batch,
+                ability_name,
+                [parameters for parameters, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+# Global instance
+mcp_dispatcher = BatchingDispatcher(mcp_client, mcp_limits)
@@ -0,0 +1,115 @@
+"""
+MCP Call Limits
+Bounds concurrency and request rate for MCP ability calls, with retry on rate limiting
+"""
+from typing import Dict, Any, Awaitable, Callable, List, Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Max in-flight MCP round-trips (a batch is one) and max round-trips started
+# per second (0 = unlimited)
+MCP_CONCURRENCY = int(os.getenv("MCP_CONCURRENCY", "16"))
+MCP_RPS = float(os.getenv("MCP_RPS", "0"))
+
+
+class RateLimiter:
+    """
+    Token-bucket style limiter that spaces call starts 1/rps seconds apart
+    """
+
+    def __init__(self, rps: float):
+        self.interval = 1.0 / rps if rps > 0 else 0.0
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        """Wait until the next call slot is available"""
+        if not self.interval:
+            return
+
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        # Reserve the slot before sleeping so concurrent callers queue up
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def is_rate_limited(result: Dict[str, Any]) -> bool:
+    """Check whether an ability result reports a rate-limit error"""
+    if result.get("success", True):
+        return False
+    error = str(result.get("error", "")).lower()
+    return "429" in error or "rate limit" in error
+
+
+class MCPLimits:
+    """
+    Applies the concurrency cap, rate limit and retry policy to MCP round-trips
+    """
+
+    def __init__(
+        self,
+        concurrency: int = MCP_CONCURRENCY,
+        rps: float = MCP_RPS,
+        attempts: int = 3,
+        base_delay: float = 0.5
+    ):
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rps)
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.concurrency)
+            self._sem_loop = loop
+        return self._sem
+
+    async def call_batch(
+        self,
+        fn: Callable[[str, List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]],
+        ability_name: str,
+        parameters_list: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Run one batched ability round-trip under the limits, retrying only
+        the rate-limited items with exponential backoff
+        """
+        results: List[Dict[str, Any]] = [{}] * len(parameters_list)
+        pending = list(range(len(parameters_list)))
+        delay = self.base_delay
+        
+        for attempt in range(1, self.attempts + 1):
+            async with self._semaphore():
+                await self.limiter.acquire()
+                batch = await fn(ability_name, [parameters_list[i] for i in pending])
+            
+            retry = []
+            for i, result in zip(pending, batch):
+                results[i] = result
+                if is_rate_limited(result):
+                    retry.append(i)
+            
+            if not retry or attempt == self.attempts:
+                break
+            
+            logger.warning(
+                "Rate limited %d/%d calls on attempt %d/%d, retrying in %.1fs",
+                len(retry), len(pending), attempt, self.attempts, delay
+            )
+            await asyncio.sleep(delay)
+            delay *= 2
+            pending = retry
+        
+        return results
+
+
+# Global instance
+mcp_limits = MCPLimits()
@@ -2,7 +2,8 @@
 Invoice Processing State Management
 Defines the state structure passed between LangGraph nodes
 """
-from typing import TypedDict, Optional, List, Dict, Any, Annotated
+from typing import TypedDict, Optional, List, Dict, Any, Annotated, Tuple, Mapping, get_type_hints
+from types import MappingProxyType
 from datetime import datetime
 import operator
 
@@ -32,10 +33,11 @@ class VendorProfile(TypedDict):
     enrichment_meta: Dict[str, Any]
 
 
-class InvoiceProcessingState(TypedDict):
+class InvoiceProcessingState(TypedDict, total=False):
     """
     Complete state structure for the invoice processing workflow.
-    This is passed through all LangGraph nodes.
+    This is passed through all LangGraph nodes. Stage outputs are only
+    present once the stage producing them has run.
     """
     # Input invoice data
     invoice_payload: InvoicePayload
@@ -63,6 +65,7 @@ class InvoiceProcessingState(TypedDict):
     history: Optional[List[Dict[str, Any]]]
     
     # MATCH_TWO_WAY stage outputs
+    po_amount: Optional[float]
     match_score: Optional[float]
     match_result: Optional[str]  # "MATCHED" or "FAILED"
     tolerance_pct: Optional[float]
@@ -98,7 +101,7 @@ class InvoiceProcessingState(TypedDict):
     
     # COMPLETE stage outputs
     final_payload: Optional[Dict[str, Any]]
-    audit_log: Annotated[List[Dict[str, Any]], operator.add]
+    audit_log: Annotated[Tuple[Dict[str, Any], ...], operator.add]
     status: Optional[str]
     
     # Workflow metadata
@@ -108,49 +111,36 @@ class InvoiceProcessingState(TypedDict):
     errors: Annotated[List[Dict[str, Any]], operator.add]
 
 
+# Reducer per Annotated state field, as the graph applies them to node updates
+_REDUCERS: Mapping[str, Any] = MappingProxyType({
+    key: hint.__metadata__[0]
+    for key, hint in get_type_hints(InvoiceProcessingState, include_extras=True).items()
+    if hasattr(hint, "__metadata__")
+})
+
+
+# Defaults for a fresh workflow state; stage outputs are left unset rather than
+# stored as None (mutable channels are created per state)
+_STATE_TEMPLATE: Mapping[str, Any] = MappingProxyType({
+    "audit_log": (),
+    "current_stage": "INTAKE"
+})
+
+
 def create_initial_state(invoice_payload: Dict[str, Any]) -> InvoiceProcessingState:
     """Create initial state from invoice payload"""
-    return InvoiceProcessingState(
-        invoice_payload=invoice_payload,
-        raw_id=None,
-        ingest_ts=None,
-        validated=None,
-        parsed_invoice=None,
-        invoice_text=None,
-        parsed_line_items=None,
-        detected_pos=None,
-        parsed_dates=None,
-        vendor_profile=None,
-        normalized_invoice=None,
-        flags=None,
-        matched_pos=None,
-        matched_grns=None,
-        history=None,
-        match_score=None,
-        match_result=None,
-        tolerance_pct=None,
-        match_evidence=None,
-        checkpoint_ref=None,
-        review_url=None,
-        paused_reason=None,
-        human_decision=None,
-        reviewer_id=None,
-        resume_token=None,
-        next_stage=None,
-        accounting_entries=None,
-        reconciliation_report=None,
-        approval_status=None,
-        approver_id=None,
-        posted=None,
-        erp_txn_id=None,
-        scheduled_payment_id=None,
-        notify_status=None,
-        notified_parties=None,
-        final_payload=None,
-        audit_log=[],
-        status=None,
-        workflow_id=None,
-        current_stage="INTAKE",
-        bigtool_selections={},
-        errors=[]
-    )
+    state = _STATE_TEMPLATE.copy()
+    state["invoice_payload"] = invoice_payload
+    state["bigtool_selections"] = {}
+    state["errors"] = []
+    return state
+
+
+def apply_update(state: InvoiceProcessingState, update: Dict[str, Any]) -> InvoiceProcessingState:
+    """Merge one node's partial update into state, applying field reducers"""
+    for key, value in update.items():
+        reducer = _REDUCERS.get(key)
+        if reducer is not None and key in state:
+            value = reducer(state[key], value)
+        state[key] = value
+    return state
@@ -3,7 +3,8 @@ Bigtool - Dynamic Tool Selection System
 Intelligently selects the best tool from a pool based on capability and context
 """
 import random
-from typing import Dict, List, Optional, Any
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Any
 from enum import Enum
 import logging
 
@@ -19,6 +20,39 @@ class ToolCapability(str, Enum):
     EMAIL = "email"
 
 
+# Max selections kept in BigtoolPicker.selection_history
+HISTORY_MAXLEN = 10_000
+
+_CAPABILITY_LOOKUP = {c.value: c for c in ToolCapability}
+
+
+class Tool(NamedTuple):
+    name: str
+    cost: str
+    accuracy: str
+    speed: str
+    available: bool
+
+
+class Selection(NamedTuple):
+    capability: str
+    selected: str
+    context: Optional[Dict[str, Any]]
+    pool_size: int
+
+
+# Rank of each tool attribute value (lower is better) per selection priority
+_SPEED_RANK = {"very_fast": 0, "fast": 1, "medium": 2, "slow": 3}
+_COST_RANK = {"free": 0, "low": 1, "medium": 2, "high": 3}
+_ACCURACY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+_PRIORITY_KEYS = {
+    "speed": lambda t: _SPEED_RANK.get(t.speed, 4),
+    "cost": lambda t: _COST_RANK.get(t.cost, 4),
+    "accuracy": lambda t: _ACCURACY_RANK.get(t.accuracy, 3)
+}
+
+
 class BigtoolPicker:
     """
     Bigtool intelligently selects tools from pools based on:
@@ -31,147 +65,49 @@ class BigtoolPicker:
     def __init__(self):
         self.tool_pools = {
             ToolCapability.OCR: [
-                {
-                    "name": "google_vision",
-                    "cost": "high",
-                    "accuracy": "high",
-                    "speed": "medium",
-                    "available": True
-                },
-                {
-                    "name": "tesseract",
-                    "cost": "free",
-                    "accuracy": "medium",
-                    "speed": "fast",
-                    "available": True
-                },
-                {
-                    "name": "aws_textract",
-                    "cost": "medium",
-                    "accuracy": "high",
-                    "speed": "medium",
-                    "available": True
-                }
+                Tool("google_vision", cost="high", accuracy="high", speed="medium", available=True),
+                Tool("tesseract", cost="free", accuracy="medium", speed="fast", available=True),
+                Tool("aws_textract", cost="medium", accuracy="high", speed="medium", available=True)
             ],
             ToolCapability.ENRICHMENT: [
-                {
-                    "name": "clearbit",
-                    "cost": "high",
-                    "accuracy": "high",
-                    "speed": "fast",
-                    "available": True
-                },
-                {
-                    "name": "people_data_labs",
-                    "cost": "medium",
-                    "accuracy": "medium",
-                    "speed": "fast",
-                    "available": True
-                },
-                {
-                    "name": "vendor_db",
-                    "cost": "free",
-                    "accuracy": "medium",
-                    "speed": "very_fast",
-                    "available": True
-                }
+                Tool("clearbit", cost="high", accuracy="high", speed="fast", available=True),
+                Tool("people_data_labs", cost="medium", accuracy="medium", speed="fast", available=True),
+                Tool("vendor_db", cost="free", accuracy="medium", speed="very_fast", available=True)
             ],
             ToolCapability.ERP_CONNECTOR: [
-                {
-                    "name": "sap_sandbox",
-                    "cost": "free",
-                    "accuracy": "high",
-                    "speed": "medium",
-                    "available": True
-                },
-                {
-                    "name": "netsuite",
-                    "cost": "medium",
-                    "accuracy": "high",
-                    "speed": "medium",
-                    "available": True
-                },
-                {
-                    "name": "mock_erp",
-                    "cost": "free",
-                    "accuracy": "high",
-                    "speed": "very_fast",
-                    "available": True
-                }
+                Tool("sap_sandbox", cost="free", accuracy="high", speed="medium", available=True),
+                Tool("netsuite", cost="medium", accuracy="high", speed="medium", available=True),
+                Tool("mock_erp", cost="free", accuracy="high", speed="very_fast", available=True)
             ],
             ToolCapability.STORAGE: [
-                {
-                    "name": "s3",
-                    "cost": "low",
-                    "accuracy": "high",
-                    "speed": "fast",
-                    "available": True
-                },
-                {
-                    "name": "gcs",
-                    "cost": "low",
-                    "accuracy": "high",
-                    "speed": "fast",
-                    "available": True
-                },
-                {
-                    "name": "local_fs",
-                    "cost": "free",
-                    "accuracy": "high",
-                    "speed": "very_fast",
-                    "available": True
-                }
+                Tool("s3", cost="low", accuracy="high", speed="fast", available=True),
+                Tool("gcs", cost="low", accuracy="high", speed="fast", available=True),
+                Tool("local_fs", cost="free", accuracy="high", speed="very_fast", available=True)
             ],
             ToolCapability.DB: [
-                {
-                    "name": "postgres",
-                    "cost": "medium",
-                    "accuracy": "high",
-                    "speed": "fast",
-                    "available": True
-                },
-                {
-                    "name": "sqlite",
-                    "cost": "free",
-                    "accuracy": "high",
-                    "speed": "very_fast",
-                    "available": True
-                },
-                {
-                    "name": "dynamodb",
-                    "cost": "low",
-                    "accuracy": "high",
-                    "speed": "fast",
-                    "available": False
-                }
+                Tool("postgres", cost="medium", accuracy="high", speed="fast", available=True),
+                Tool("sqlite", cost="free", accuracy="high", speed="very_fast", available=True),
+                Tool("dynamodb", cost="low", accuracy="high", speed="fast", available=False)
             ],
             ToolCapability.EMAIL: [
-                {
-                    "name": "sendgrid",
-                    "cost": "medium",
-                    "accuracy": "high",
-                    "speed": "fast",
-                    "available": True
-                },
-                {
-                    "name": "smartlead",
-                    "cost": "medium",
-                    "accuracy": "high",
-                    "speed": "medium",
-                    "available": False
-                },
-                {
-                    "name": "ses",
-                    "cost": "low",
-                    "accuracy": "high",
-                    "speed": "fast",
-                    "available": True
-                }
+                Tool("sendgrid", cost="medium", accuracy="high", speed="fast", available=True),
+                Tool("smartlead", cost="medium", accuracy="high", speed="medium", available=False),
+                Tool("ses", cost="low", accuracy="high", speed="fast", available=True)
             ]
         }
         
-        # Tool selection history for optimization
-        self.selection_history: List[Dict[str, Any]] = []
+        # Available tools per capability, pre-sorted for each priority
+        # ("balanced" keeps pool order); pools are static, so sort once
+        self._ranked: Dict[ToolCapability, Dict[str, List[Tool]]] = {}
+        for cap, pool in self.tool_pools.items():
+            available = [tool for tool in pool if tool.available]
+            views = {"balanced": available}
+            for priority, key in _PRIORITY_KEYS.items():
+                views[priority] = sorted(available, key=key)
+            self._ranked[cap] = views
+        
+        # Tool selection history for optimization (most recent selections only)
+        self.selection_history: Deque[Selection] = deque(maxlen=HISTORY_MAXLEN)
     
     def select(
         self, 
@@ -190,84 +126,59 @@ class BigtoolPicker:
         Returns:
             Selected tool information including name and metadata
         """
-        try:
-            cap_enum = ToolCapability(capability)
-        except ValueError:
-            logger.error(f"Unknown capability: {capability}")
+        cap_enum = _CAPABILITY_LOOKUP.get(capability)
+        if cap_enum is None:
+            logger.error("Unknown capability: %s", capability)
             return {"name": "mock_tool", "error": "Unknown capability"}
         
-        available_tools = [
-            tool for tool in self.tool_pools.get(cap_enum, [])
-            if tool["available"]
-        ]
+        # Selection strategy based on context
+        priority = context.get("priority", "balanced") if context else "balanced"
+        views = self._ranked.get(cap_enum, {"balanced": []})
+        available_tools = views.get(priority, views["balanced"])
         
         if not available_tools:
-            logger.warning(f"No available tools for capability: {capability}")
+            logger.warning("No available tools for capability: %s", capability)
             return {"name": "mock_tool", "error": "No available tools"}
         
-        # Filter by pool_hint if provided
-        if pool_hint:
-            preferred_tools = [
-                tool for tool in available_tools
-                if tool["name"] in pool_hint
-            ]
-            if preferred_tools:
-                available_tools = preferred_tools
-        
-        # Selection strategy based on context
-        if context:
-            priority = context.get("priority", "balanced")
-            
-            if priority == "speed":
-                # Prioritize speed
-                available_tools.sort(
-                    key=lambda t: {"very_fast": 0, "fast": 1, "medium": 2, "slow": 3}.get(t["speed"], 4)
-                )
-            elif priority == "cost":
-                # Prioritize low cost
-                available_tools.sort(
-                    key=lambda t: {"free": 0, "low": 1, "medium": 2, "high": 3}.get(t["cost"], 4)
-                )
-            elif priority == "accuracy":
-                # Prioritize accuracy
-                available_tools.sort(
-                    key=lambda t: {"high": 0, "medium": 1, "low": 2}.get(t["accuracy"], 3)
-                )
-        
-        # Select the top tool
+        # Select the top tool, preferring pool_hint tools when any are available
         selected_tool = available_tools[0]
+        pool_size = len(available_tools)
+        if pool_hint:
+            hint = frozenset(pool_hint)
+            preferred = next((tool for tool in available_tools if tool.name in hint), None)
+            if preferred is not None:
+                selected_tool = preferred
+                pool_size = sum(1 for tool in available_tools if tool.name in hint)
         
         # Log selection
-        selection_record = {
-            "capability": capability,
-            "selected": selected_tool["name"],
-            "context": context,
-            "pool_size": len(available_tools)
-        }
-        self.selection_history.append(selection_record)
-        
-        logger.info(
-            f"Bigtool selected '{selected_tool['name']}' for capability '{capability}' "
-            f"(context: {context})"
+        self.selection_history.append(
+            Selection(capability, selected_tool.name, context, pool_size)
         )
         
+        # Skip formatting the context dict when INFO is filtered out
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Bigtool selected '%s' for capability '%s' (context: %s)",
+                selected_tool.name, capability, context
+            )
+        
         return {
-            "name": selected_tool["name"],
+            "name": selected_tool.name,
             "capability": capability,
             "metadata": {
-                "cost": selected_tool["cost"],
-                "accuracy": selected_tool["accuracy"],
-                "speed": selected_tool["speed"]
+                "cost": selected_tool.cost,
+                "accuracy": selected_tool.accuracy,
+                "speed": selected_tool.speed
             }
         }
     
-    def get_selection_history(self) -> List[Dict[str, Any]]:
+    def get_selection_history(self) -> List[Selection]:
         """Get the history of tool selections"""
-        return self.selection_history.copy()
+        return list(self.selection_history)
     
     def reset_history(self):
         """Clear selection history"""
-        self.selection_history = []
+        self.selection_history.clear()
 
 
 # Global instance
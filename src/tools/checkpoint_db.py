@@ -2,14 +2,309 @@
 Checkpoint Database System
 Stores workflow state for HITL (Human-In-The-Loop) review
 """
-import json
+import orjson
 import sqlite3
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import asyncio
+import threading
+import hashlib
+import atexit
+import os
+import time
+from typing import Dict, Any, Optional, List, Callable, Iterator
+from datetime import datetime, timedelta, timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Review page base URL; a checkpoint's review URL is this plus its ID
+_REVIEW_BASE = os.getenv("REVIEW_BASE_URL", "http://localhost:8000/review/")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _now_us() -> int:
+    """Current UTC time as integer epoch microseconds (the stored timestamp format)"""
+    return time.time_ns() // 1000
+
+
+def _to_us(value: Any) -> Any:
+    """Convert a legacy text timestamp (ISO or digit string) to epoch microseconds"""
+    if not isinstance(value, str):
+        return value
+    if value.isdigit():
+        return int(value)
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _iso(value: Any) -> Any:
+    """Render a stored timestamp as a naive UTC ISO string"""
+    # NULL (e.g. an undecided checkpoint) passes through
+    if isinstance(value, int):
+        return (_EPOCH + timedelta(microseconds=value)).isoformat()
+    return value
+
+
+# Table column definitions, shared by init_db and the timestamp migration
+_TABLE_COLUMNS = {
+    "checkpoints": """(
+        checkpoint_id TEXT PRIMARY KEY,
+        workflow_id TEXT NOT NULL,
+        invoice_id TEXT NOT NULL,
+        state_blob BLOB NOT NULL,
+        paused_reason TEXT,
+        created_at INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        reviewer_id TEXT,
+        decision TEXT,
+        decision_notes TEXT,
+        decided_at INTEGER
+    )""",
+    "human_review_queue": """(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        checkpoint_id TEXT NOT NULL,
+        invoice_id TEXT NOT NULL,
+        vendor_name TEXT,
+        amount REAL,
+        currency TEXT,
+        reason_for_hold TEXT,
+        review_url TEXT,
+        created_at INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        FOREIGN KEY (checkpoint_id) REFERENCES checkpoints(checkpoint_id)
+    )""",
+    "payload_cache": """(
+        payload_hash TEXT PRIMARY KEY,
+        checkpoint_id TEXT NOT NULL,
+        created_at INTEGER NOT NULL,
+        FOREIGN KEY (checkpoint_id) REFERENCES checkpoints(checkpoint_id)
+    )""",
+    "decision_summary": """(
+        checkpoint_id TEXT PRIMARY KEY,
+        invoice_id TEXT NOT NULL,
+        vendor_name TEXT,
+        amount REAL,
+        currency TEXT,
+        decision TEXT NOT NULL,
+        notes TEXT,
+        reviewer TEXT,
+        decided_at INTEGER,
+        FOREIGN KEY (checkpoint_id) REFERENCES checkpoints(checkpoint_id)
+    )""",
+    "audit_log": """(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workflow_id TEXT NOT NULL,
+        stage TEXT NOT NULL,
+        action TEXT NOT NULL,
+        details TEXT,
+        timestamp INTEGER NOT NULL
+    )"""
+}
+
+_CREATE_TABLE = "CREATE TABLE IF NOT EXISTS {table} {columns}"
+
+# Timestamp columns per table. Databases created before timestamps became
+# integers declare them TEXT, so stored values keep text affinity; init_db
+# rebuilds those tables with INTEGER columns.
+_TIMESTAMP_COLUMNS = {
+    "checkpoints": ("created_at", "decided_at"),
+    "human_review_queue": ("created_at",),
+    "payload_cache": ("created_at",),
+    "decision_summary": ("decided_at",),
+    "audit_log": ("timestamp",)
+}
+
+# SQL statements, kept as module constants so every call passes the same
+# string and hits sqlite3's prepared statement cache
+_INSERT_CHECKPOINT = """
+    INSERT INTO checkpoints
+    (checkpoint_id, workflow_id, invoice_id, state_blob, paused_reason, created_at, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_REVIEW = """
+    INSERT INTO human_review_queue
+    (checkpoint_id, invoice_id, vendor_name, amount, currency, reason_for_hold, review_url, created_at, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_SELECT_PENDING_BY_PAYLOAD_HASH = """
+    SELECT p.checkpoint_id
+    FROM payload_cache p
+    JOIN checkpoints c ON c.checkpoint_id = p.checkpoint_id
+    WHERE p.payload_hash = ? AND c.status = 'PENDING'
+"""
+
+_UPSERT_PAYLOAD_HASH = """
+    INSERT OR REPLACE INTO payload_cache (payload_hash, checkpoint_id, created_at)
+    VALUES (?, ?, ?)
+"""
+
+_SELECT_PENDING_REVIEWS = """
+    SELECT checkpoint_id, invoice_id, vendor_name, amount, currency,
+           reason_for_hold, review_url, created_at
+    FROM human_review_queue
+    WHERE status = 'PENDING'
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+_SELECT_CHECKPOINT = """
+    SELECT checkpoint_id, workflow_id, invoice_id, state_blob AS state,
+           paused_reason, status, decision, decision_notes, reviewer_id
+    FROM checkpoints
+    WHERE checkpoint_id = ?
+"""
+
+_SELECT_CHECKPOINT_META = """
+    SELECT checkpoint_id, workflow_id, invoice_id, paused_reason, status,
+           decision, decision_notes, reviewer_id
+    FROM checkpoints
+    WHERE checkpoint_id = ?
+"""
+
+_UPDATE_CHECKPOINT_DECISION = """
+    UPDATE checkpoints
+    SET status = ?, decision = ?, reviewer_id = ?, decision_notes = ?, decided_at = ?
+    WHERE checkpoint_id = ?
+"""
+
+_CLAIM_CHECKPOINT = """
+    UPDATE checkpoints
+    SET status = 'RESOLVED', decision = ?, reviewer_id = ?, decision_notes = ?, decided_at = ?
+    WHERE checkpoint_id = ? AND status = 'PENDING'
+"""
+
+_RELEASE_CHECKPOINT = """
+    UPDATE checkpoints
+    SET status = 'PENDING', decision = NULL, reviewer_id = NULL, decision_notes = NULL, decided_at = NULL
+    WHERE checkpoint_id = ? AND status = 'RESOLVED'
+"""
+
+_DELETE_DECISION_SUMMARY = """
+    DELETE FROM decision_summary
+    WHERE checkpoint_id = ?
+"""
+
+_RESOLVE_REVIEW = """
+    UPDATE human_review_queue
+    SET status = ?
+    WHERE checkpoint_id = ?
+"""
+
+_DECISION_SUMMARY_UPSERT_BASE = """
+    INSERT OR REPLACE INTO decision_summary
+    SELECT c.checkpoint_id, c.invoice_id, h.vendor_name, h.amount, h.currency,
+           c.decision, c.decision_notes, c.reviewer_id, c.decided_at
+    FROM checkpoints c
+    LEFT JOIN human_review_queue h ON c.checkpoint_id = h.checkpoint_id
+"""
+
+_UPSERT_DECISION_SUMMARY = _DECISION_SUMMARY_UPSERT_BASE + """
+    WHERE c.checkpoint_id = ?
+"""
+
+_BACKFILL_DECISION_SUMMARY = _DECISION_SUMMARY_UPSERT_BASE + """
+    WHERE c.status = 'RESOLVED' AND c.decision IS NOT NULL
+"""
+
+_INSERT_AUDIT_LOG = """
+    INSERT INTO audit_log (workflow_id, stage, action, details, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+_SELECT_AUDIT_LOG = """
+    SELECT stage, action, details, timestamp
+    FROM audit_log
+    WHERE workflow_id = ?
+    ORDER BY timestamp ASC
+"""
+
+_SELECT_AUDIT_LOG_CHUNK = """
+    SELECT id, stage, action, details, timestamp
+    FROM audit_log
+    WHERE workflow_id = ?
+      AND (timestamp > ? OR (timestamp = ? AND id > ?))
+    ORDER BY timestamp ASC, id ASC
+    LIMIT ?
+"""
+
+_SELECT_DECISIONS = """
+    SELECT checkpoint_id, invoice_id, vendor_name, amount, currency,
+           decision, notes, reviewer, decided_at
+    FROM decision_summary
+    WHERE decision = ?
+    ORDER BY decided_at DESC
+"""
+
+
+class AsyncBatcher:
+    """
+    Coalesces concurrent submissions into batches handled by one call.
+    A batch is flushed when it reaches max_batch_size or when the oldest
+    item has waited max_queue_time seconds.
+    """
+    
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 16,
+        max_queue_time: float = 0.05
+    ):
+        self.flush_fn = flush_fn
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self._items: List[Any] = []
+        self._futures: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result from the batch flush"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        
+        if len(self._items) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_queue_time, self.flush)
+        
+        return await future
+    
+    def flush(self):
+        """
+        Write all queued items in one call on a worker thread and resolve
+        their futures when it finishes
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        if not items:
+            return
+        
+        write = asyncio.get_running_loop().run_in_executor(None, self.flush_fn, items)
+        write.add_done_callback(lambda w: self._resolve(w, futures))
+    
+    @staticmethod
+    def _resolve(write: asyncio.Future, futures: List[asyncio.Future]):
+        """Fan the batch result (or its error) back out to each caller"""
+        error = asyncio.CancelledError() if write.cancelled() else write.exception()
+        if error is not None:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        
+        for future, result in zip(futures, write.result()):
+            if not future.done():
+                future.set_result(result)
+
 
 class CheckpointDB:
     """
@@ -18,62 +313,119 @@ class CheckpointDB:
     
     def __init__(self, db_path: str = "./demo.db"):
         self.db_path = db_path
+        
+        # One long-lived connection shared by all callers (event loop and
+        # worker threads). SQLite allows a single writer, so every access
+        # is serialized behind a lock.
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=256)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        self._conn.execute("PRAGMA cache_size=-20000")
+        self._lock = threading.Lock()
+        self._pending_batcher: Optional[AsyncBatcher] = None
+        self._pending_batcher_loop = None
         self.init_db()
     
     def init_db(self):
         """Initialize database tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Checkpoints table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS checkpoints (
-                checkpoint_id TEXT PRIMARY KEY,
-                workflow_id TEXT NOT NULL,
-                invoice_id TEXT NOT NULL,
-                state_blob TEXT NOT NULL,
-                paused_reason TEXT,
-                created_at TEXT NOT NULL,
-                status TEXT NOT NULL,
-                reviewer_id TEXT,
-                decision TEXT,
-                decision_notes TEXT,
-                decided_at TEXT
-            )
-        """)
-        
-        # Human review queue table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS human_review_queue (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                checkpoint_id TEXT NOT NULL,
-                invoice_id TEXT NOT NULL,
-                vendor_name TEXT,
-                amount REAL,
-                currency TEXT,
-                reason_for_hold TEXT,
-                review_url TEXT,
-                created_at TEXT NOT NULL,
-                status TEXT NOT NULL,
-                FOREIGN KEY (checkpoint_id) REFERENCES checkpoints(checkpoint_id)
-            )
-        """)
-        
-        # Audit log table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS audit_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                workflow_id TEXT NOT NULL,
-                stage TEXT NOT NULL,
-                action TEXT NOT NULL,
-                details TEXT,
-                timestamp TEXT NOT NULL
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
-        logger.info(f"Database initialized at {self.db_path}")
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            self._migrate_timestamps(cursor)
+            
+            # Checkpoints table
+            cursor.execute(_CREATE_TABLE.format(table="checkpoints", columns=_TABLE_COLUMNS["checkpoints"]))
+            
+            # Human review queue table
+            cursor.execute(_CREATE_TABLE.format(table="human_review_queue", columns=_TABLE_COLUMNS["human_review_queue"]))
+            
+            # Partial index backing get_pending_reviews (only pending rows)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS ix_review_pending
+                ON human_review_queue(created_at) WHERE status = 'PENDING'
+            """)
+            
+            # Review row lookup by checkpoint (decision updates, history join)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS ix_review_checkpoint
+                ON human_review_queue(checkpoint_id)
+            """)
+            
+            # Payload hash -> checkpoint, used to skip re-running duplicates
+            cursor.execute(_CREATE_TABLE.format(table="payload_cache", columns=_TABLE_COLUMNS["payload_cache"]))
+            
+            # Resolved reviews joined with their queue metadata, written by
+            # record_decision so get_decision_history reads without a join
+            cursor.execute("""
+                SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'decision_summary'
+            """)
+            summary_exists = cursor.fetchone() is not None
+            
+            cursor.execute(_CREATE_TABLE.format(table="decision_summary", columns=_TABLE_COLUMNS["decision_summary"]))
+            
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS ix_decision_summary
+                ON decision_summary(decision, decided_at)
+            """)
+            
+            if not summary_exists:
+                # Backfill decisions recorded before the summary table existed
+                cursor.execute(_BACKFILL_DECISION_SUMMARY)
+            
+            # Audit log table
+            cursor.execute(_CREATE_TABLE.format(table="audit_log", columns=_TABLE_COLUMNS["audit_log"]))
+            
+            # Backs get_audit_log and the keyset pagination in iter_audit_log
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS ix_audit_workflow
+                ON audit_log(workflow_id, timestamp, id)
+            """)
+            
+            self._conn.commit()
+        logger.info("Database initialized at %s", self.db_path)
+    
+    def _migrate_timestamps(self, cursor: sqlite3.Cursor):
+        """
+        Rebuild tables whose timestamp columns are still declared TEXT,
+        converting their stored values to integer epoch microseconds
+        """
+        for table, columns in _TIMESTAMP_COLUMNS.items():
+            declared = {row["name"]: row["type"].upper() for row in cursor.execute(f"PRAGMA table_info({table})")}
+            if not declared or all(declared.get(column) == "INTEGER" for column in columns):
+                continue
+            
+            logger.info("Migrating %s timestamps to integer epoch microseconds", table)
+            names = list(declared)
+            positions = [names.index(column) for column in columns if column in declared]
+            column_list = ", ".join(names)
+            
+            try:
+                cursor.execute("BEGIN")
+                cursor.execute(_CREATE_TABLE.format(table=f"{table}_migrated", columns=_TABLE_COLUMNS[table]))
+                
+                rows = []
+                for row in cursor.execute(f"SELECT {column_list} FROM {table}").fetchall():
+                    values = list(row)
+                    for i in positions:
+                        values[i] = _to_us(values[i])
+                    rows.append(values)
+                cursor.executemany(
+                    f"INSERT INTO {table}_migrated ({column_list}) VALUES ({', '.join('?' * len(names))})",
+                    rows
+                )
+                
+                # Dropping the old table also drops its indexes; init_db recreates them
+                cursor.execute(f"DROP TABLE {table}")
+                cursor.execute(f"ALTER TABLE {table}_migrated RENAME TO {table}")
+                self._conn.commit()
+            
+            except Exception as e:
+                logger.error("Error migrating %s timestamps: %s", table, e)
+                self._conn.rollback()
+                raise
     
     def create_checkpoint(
         self,
@@ -86,36 +438,29 @@ class CheckpointDB:
         """
         Create a checkpoint for HITL review
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        created_at = datetime.utcnow().isoformat()
-        state_blob = json.dumps(state)
-        
-        try:
-            cursor.execute("""
-                INSERT INTO checkpoints 
-                (checkpoint_id, workflow_id, invoice_id, state_blob, paused_reason, created_at, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (checkpoint_id, workflow_id, invoice_id, state_blob, paused_reason, created_at, "PENDING"))
+        with self._lock:
+            cursor = self._conn.cursor()
             
-            conn.commit()
+            created_at = _now_us()
+            state_blob = orjson.dumps(state)
             
-            logger.info(f"Checkpoint created: {checkpoint_id}")
+            try:
+                cursor.execute(_INSERT_CHECKPOINT, (checkpoint_id, workflow_id, invoice_id, state_blob, paused_reason, created_at, "PENDING"))
+                
+                self._conn.commit()
+                
+                logger.info("Checkpoint created: %s", checkpoint_id)
+                
+                return {
+                    "checkpoint_id": checkpoint_id,
+                    "created_at": _iso(created_at),
+                    "status": "PENDING"
+                }
             
-            return {
-                "checkpoint_id": checkpoint_id,
-                "created_at": created_at,
-                "status": "PENDING"
-            }
-        
-        except Exception as e:
-            logger.error(f"Error creating checkpoint: {str(e)}")
-            conn.rollback()
-            raise
-        
-        finally:
-            conn.close()
+            except Exception as e:
+                logger.error("Error creating checkpoint: %s", e)
+                self._conn.rollback()
+                raise
     
     def add_to_review_queue(
         self,
@@ -126,106 +471,202 @@ class CheckpointDB:
         """
         Add checkpoint to human review queue
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        created_at = datetime.utcnow().isoformat()
-        review_url = f"http://localhost:8000/review/{checkpoint_id}"
-        
-        try:
-            cursor.execute("""
-                INSERT INTO human_review_queue
-                (checkpoint_id, invoice_id, vendor_name, amount, currency, reason_for_hold, review_url, created_at, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                checkpoint_id,
-                invoice_data.get("invoice_id", "unknown"),
-                invoice_data.get("vendor_name", "unknown"),
-                invoice_data.get("amount", 0),
-                invoice_data.get("currency", "USD"),
-                reason,
-                review_url,
-                created_at,
-                "PENDING"
-            ))
-            
-            conn.commit()
-            
-            logger.info(f"Added to review queue: {checkpoint_id}")
-            
-            return review_url
-        
-        except Exception as e:
-            logger.error(f"Error adding to review queue: {str(e)}")
-            conn.rollback()
-            raise
-        
-        finally:
-            conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            created_at = _now_us()
+            review_url = _REVIEW_BASE + checkpoint_id
+            
+            try:
+                cursor.execute(_INSERT_REVIEW, self._review_row(checkpoint_id, invoice_data, reason, review_url, created_at))
+                
+                self._conn.commit()
+                
+                logger.info("Added to review queue: %s", checkpoint_id)
+                
+                return review_url
+            
+            except Exception as e:
+                logger.error("Error adding to review queue: %s", e)
+                self._conn.rollback()
+                raise
+    
+    @staticmethod
+    def _review_row(
+        checkpoint_id: str,
+        invoice_data: Dict[str, Any],
+        reason: str,
+        review_url: str,
+        created_at: int
+    ) -> tuple:
+        """Build the human_review_queue parameter row for a pending checkpoint"""
+        return (
+            checkpoint_id,
+            invoice_data.get("invoice_id", "unknown"),
+            invoice_data.get("vendor_name", "unknown"),
+            invoice_data.get("amount", 0),
+            invoice_data.get("currency", "USD"),
+            reason,
+            review_url,
+            created_at,
+            "PENDING"
+        )
+    
+    def create_pending_checkpoints(
+        self,
+        entries: List[Dict[str, Any]]
+    ) -> List[str]:
+        """
+        Create checkpoints and their review queue rows for many
+        invoices in a single transaction. Returns the review URLs.
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            created_at = _now_us()
+            review_urls = [
+                _REVIEW_BASE + entry["checkpoint_id"]
+                for entry in entries
+            ]
+            
+            try:
+                cursor.executemany(_INSERT_CHECKPOINT, [
+                    (
+                        entry["checkpoint_id"],
+                        entry["workflow_id"],
+                        entry["invoice_id"],
+                        orjson.dumps(entry["state"]),
+                        entry["paused_reason"],
+                        created_at,
+                        "PENDING"
+                    )
+                    for entry in entries
+                ])
+                
+                cursor.executemany(_INSERT_REVIEW, [
+                    self._review_row(
+                        entry["checkpoint_id"], entry["invoice_data"], entry["reason"], review_url, created_at
+                    )
+                    for entry, review_url in zip(entries, review_urls)
+                ])
+                
+                self._conn.commit()
+                
+                logger.info("Pending checkpoints created: %s", len(entries))
+                
+                return review_urls
+            
+            except Exception as e:
+                logger.error("Error creating pending checkpoints: %s", e)
+                self._conn.rollback()
+                raise
     
-    def get_pending_reviews(self) -> List[Dict[str, Any]]:
+    async def enqueue_pending(
+        self,
+        checkpoint_id: str,
+        workflow_id: str,
+        invoice_id: str,
+        state: Dict[str, Any],
+        paused_reason: str,
+        invoice_data: Dict[str, Any],
+        reason: str
+    ) -> str:
         """
-        Get all pending reviews from the queue
+        Create a checkpoint and queue it for review. Concurrent calls are
+        coalesced into one transaction. Returns the review URL.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        loop = asyncio.get_running_loop()
+        if self._pending_batcher is None or self._pending_batcher_loop is not loop:
+            self._pending_batcher = AsyncBatcher(self.create_pending_checkpoints)
+            self._pending_batcher_loop = loop
         
-        cursor.execute("""
-            SELECT checkpoint_id, invoice_id, vendor_name, amount, currency, 
-                   reason_for_hold, review_url, created_at
-            FROM human_review_queue
-            WHERE status = 'PENDING'
-            ORDER BY created_at DESC
-        """)
+        return await self._pending_batcher.submit({
+            "checkpoint_id": checkpoint_id,
+            "workflow_id": workflow_id,
+            "invoice_id": invoice_id,
+            "state": state,
+            "paused_reason": paused_reason,
+            "invoice_data": invoice_data,
+            "reason": reason
+        })
+    
+    def get_pending_by_payload_hash(self, payload_hash: str) -> Optional[str]:
+        """
+        Get the checkpoint ID of a still-pending run of an identical payload
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute(_SELECT_PENDING_BY_PAYLOAD_HASH, (payload_hash,))
+            
+            row = cursor.fetchone()
         
-        rows = cursor.fetchall()
-        conn.close()
+        return row[0] if row else None
+    
+    def record_payload_hash(self, payload_hash: str, checkpoint_id: str):
+        """
+        Remember which checkpoint a payload produced
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            created_at = _now_us()
+            
+            try:
+                cursor.execute(_UPSERT_PAYLOAD_HASH, (payload_hash, checkpoint_id, created_at))
+                
+                self._conn.commit()
+            
+            except Exception as e:
+                logger.error("Error recording payload hash: %s", e)
+                self._conn.rollback()
+    
+    def get_pending_reviews(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get pending reviews from the queue, newest first (all if no limit)
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute(_SELECT_PENDING_REVIEWS, (limit if limit is not None else -1,))
+            
+            rows = cursor.fetchall()
         
-        return [
-            {
-                "checkpoint_id": row[0],
-                "invoice_id": row[1],
-                "vendor_name": row[2],
-                "amount": row[3],
-                "currency": row[4],
-                "reason_for_hold": row[5],
-                "review_url": row[6],
-                "created_at": row[7]
-            }
-            for row in rows
-        ]
+        reviews = [dict(row) for row in rows]
+        for review in reviews:
+            review["created_at"] = _iso(review["created_at"])
+        return reviews
     
     def get_checkpoint(self, checkpoint_id: str) -> Optional[Dict[str, Any]]:
         """
         Retrieve checkpoint state
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT workflow_id, invoice_id, state_blob, paused_reason, status, 
-                   decision, decision_notes, reviewer_id
-            FROM checkpoints
-            WHERE checkpoint_id = ?
-        """, (checkpoint_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute(_SELECT_CHECKPOINT, (checkpoint_id,))
+            
+            row = cursor.fetchone()
         
         if not row:
             return None
         
-        return {
-            "checkpoint_id": checkpoint_id,
-            "workflow_id": row[0],
-            "invoice_id": row[1],
-            "state": json.loads(row[2]),
-            "paused_reason": row[3],
-            "status": row[4],
-            "decision": row[5],
-            "decision_notes": row[6],
-            "reviewer_id": row[7]
-        }
+        checkpoint = dict(row)
+        checkpoint["state"] = orjson.loads(checkpoint["state"])
+        return checkpoint
+    
+    def get_checkpoint_meta(self, checkpoint_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve checkpoint status and decision without loading its state
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute(_SELECT_CHECKPOINT_META, (checkpoint_id,))
+            
+            row = cursor.fetchone()
+        
+        return dict(row) if row else None
     
     def record_decision(
         self,
@@ -237,39 +678,95 @@ class CheckpointDB:
         """
         Record human decision on a checkpoint
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        decided_at = datetime.utcnow().isoformat()
-        
-        try:
-            # Update checkpoint
-            cursor.execute("""
-                UPDATE checkpoints
-                SET status = ?, decision = ?, reviewer_id = ?, decision_notes = ?, decided_at = ?
-                WHERE checkpoint_id = ?
-            """, ("RESOLVED", decision, reviewer_id, notes, decided_at, checkpoint_id))
+        with self._lock:
+            cursor = self._conn.cursor()
             
-            # Update review queue
-            cursor.execute("""
-                UPDATE human_review_queue
-                SET status = ?
-                WHERE checkpoint_id = ?
-            """, ("RESOLVED", checkpoint_id))
+            decided_at = _now_us()
+            
+            try:
+                # Update checkpoint
+                cursor.execute(_UPDATE_CHECKPOINT_DECISION, ("RESOLVED", decision, reviewer_id, notes, decided_at, checkpoint_id))
+                
+                # Update review queue
+                cursor.execute(_RESOLVE_REVIEW, ("RESOLVED", checkpoint_id))
+                
+                # Update decision summary
+                cursor.execute(_UPSERT_DECISION_SUMMARY, (checkpoint_id,))
+                
+                self._conn.commit()
+                
+                logger.info("Decision recorded for checkpoint %s: %s", checkpoint_id, decision)
+                
+                return True
             
-            conn.commit()
+            except Exception as e:
+                logger.error("Error recording decision: %s", e)
+                self._conn.rollback()
+                return False
+    
+    def claim_checkpoint(
+        self,
+        checkpoint_id: str,
+        decision: str,
+        reviewer_id: str,
+        notes: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Record a human decision and load the checkpoint in one transaction.
+        Only a PENDING checkpoint can be claimed, so two reviewers cannot
+        resolve the same one; returns None if it is missing or already resolved.
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
             
-            logger.info(f"Decision recorded for checkpoint {checkpoint_id}: {decision}")
+            try:
+                cursor.execute(_CLAIM_CHECKPOINT, (decision, reviewer_id, notes, _now_us(), checkpoint_id))
+                if cursor.rowcount == 0:
+                    self._conn.rollback()
+                    return None
+                
+                cursor.execute(_SELECT_CHECKPOINT, (checkpoint_id,))
+                row = cursor.fetchone()
+                
+                cursor.execute(_RESOLVE_REVIEW, ("RESOLVED", checkpoint_id))
+                cursor.execute(_UPSERT_DECISION_SUMMARY, (checkpoint_id,))
+                
+                self._conn.commit()
             
-            return True
+            except Exception as e:
+                logger.error("Error claiming checkpoint: %s", e)
+                self._conn.rollback()
+                raise
         
-        except Exception as e:
-            logger.error(f"Error recording decision: {str(e)}")
-            conn.rollback()
-            return False
+        logger.info("Decision recorded for checkpoint %s: %s", checkpoint_id, decision)
         
-        finally:
-            conn.close()
+        checkpoint = dict(row)
+        checkpoint["state"] = orjson.loads(checkpoint["state"])
+        return checkpoint
+    
+    def release_checkpoint(self, checkpoint_id: str) -> bool:
+        """
+        Undo claim_checkpoint after the resumed workflow failed: the checkpoint
+        and its review row go back to PENDING so the decision can be retried
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            try:
+                cursor.execute(_RELEASE_CHECKPOINT, (checkpoint_id,))
+                cursor.execute(_RESOLVE_REVIEW, ("PENDING", checkpoint_id))
+                cursor.execute(_DELETE_DECISION_SUMMARY, (checkpoint_id,))
+                
+                self._conn.commit()
+                
+                logger.info("Checkpoint released for retry: %s", checkpoint_id)
+                
+                return True
+            
+            except Exception as e:
+                logger.error("Error releasing checkpoint: %s", e)
+                self._conn.rollback()
+                return False
     
     def add_audit_log(
         self,
@@ -281,99 +778,214 @@ class CheckpointDB:
         """
         Add entry to audit log
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        timestamp = datetime.utcnow().isoformat()
-        details_json = json.dumps(details) if details else None
-        
-        try:
-            cursor.execute("""
-                INSERT INTO audit_log (workflow_id, stage, action, details, timestamp)
-                VALUES (?, ?, ?, ?, ?)
-            """, (workflow_id, stage, action, details_json, timestamp))
+        with self._lock:
+            cursor = self._conn.cursor()
             
-            conn.commit()
-        
-        except Exception as e:
-            logger.error(f"Error adding audit log: {str(e)}")
-            conn.rollback()
+            timestamp = _now_us()
+            details_json = orjson.dumps(details).decode() if details else None
+            
+            try:
+                cursor.execute(_INSERT_AUDIT_LOG, (workflow_id, stage, action, details_json, timestamp))
+                
+                self._conn.commit()
+            
+            except Exception as e:
+                logger.error("Error adding audit log: %s", e)
+                self._conn.rollback()
+    
+    def add_audit_log_batch(self, rows: List[tuple]):
+        """
+        Add many audit log entries in one INSERT
         
-        finally:
-            conn.close()
+        Args:
+            rows: (workflow_id, stage, action, details, timestamp) tuples
+        """
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            try:
+                cursor.executemany(_INSERT_AUDIT_LOG, [
+                    (workflow_id, stage, action, orjson.dumps(details).decode() if details else None, timestamp)
+                    for workflow_id, stage, action, details, timestamp in rows
+                ])
+                
+                self._conn.commit()
+            
+            except Exception as e:
+                logger.error("Error adding audit log batch: %s", e)
+                self._conn.rollback()
     
     def get_audit_log(self, workflow_id: str) -> List[Dict[str, Any]]:
         """
-        Get audit log for a workflow
+        Get audit log for a workflow. Use iter_audit_log to stream
+        long logs in chunks instead of materializing them.
         """
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT stage, action, details, timestamp
-            FROM audit_log
-            WHERE workflow_id = ?
-            ORDER BY timestamp ASC
-        """, (workflow_id,))
-        
-        rows = cursor.fetchall()
-        conn.close()
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            cursor.execute(_SELECT_AUDIT_LOG, (workflow_id,))
+            
+            # Build entries straight off the cursor rather than fetchall()
+            # first, so rows are never held twice
+            return [self._audit_entry(row) for row in cursor]
+    
+    def iter_audit_log(
+        self,
+        workflow_id: str,
+        chunk_size: int = 200
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Iterate over the audit log for a workflow in chunks of entries.
+        Each chunk is a separate keyset-paginated query, so the connection
+        is not held between chunks.
+        """
+        # -1 sorts before every stored timestamp (integer or legacy text)
+        last_ts, last_id = -1, 0
         
-        return [
-            {
-                "stage": row[0],
-                "action": row[1],
-                "details": json.loads(row[2]) if row[2] else None,
-                "timestamp": row[3]
-            }
-            for row in rows
-        ]
+        while True:
+            with self._lock:
+                cursor = self._conn.cursor()
+                
+                cursor.execute(_SELECT_AUDIT_LOG_CHUNK, (workflow_id, last_ts, last_ts, last_id, chunk_size))
+                
+                rows = cursor.fetchall()
+            
+            if not rows:
+                return
+            
+            last_id, last_ts = rows[-1]["id"], rows[-1]["timestamp"]
+            yield [self._audit_entry(row) for row in rows]
+            
+            if len(rows) < chunk_size:
+                return
+    
+    @staticmethod
+    def _audit_entry(row: sqlite3.Row) -> Dict[str, Any]:
+        """Build an audit log entry from a row, decoding its details"""
+        entry = {
+            "stage": row["stage"],
+            "action": row["action"],
+            "details": row["details"],
+            "timestamp": _iso(row["timestamp"])
+        }
+        if entry["details"]:
+            entry["details"] = orjson.loads(entry["details"])
+        return entry
     
     def get_decision_history(self) -> Dict[str, List[Dict[str, Any]]]:
         """
         Get history of resolved reviews, classified by decision
         """
-        
-        # correcting the SQL to join with human_review_queue for metadata
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT c.checkpoint_id, c.invoice_id, h.vendor_name, h.amount, h.currency, 
-                   c.decision, c.decision_notes, c.reviewer_id, c.decided_at
-            FROM checkpoints c
-            LEFT JOIN human_review_queue h ON c.checkpoint_id = h.checkpoint_id
-            WHERE c.status = 'RESOLVED' AND c.decision IS NOT NULL
-            ORDER BY c.decided_at DESC
-        """)
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
         history = {
             "ACCEPT": [],
             "REJECT": []
         }
         
-        for row in rows:
-            decision = row[5] 
-            item = {
-                "checkpoint_id": row[0],
-                "invoice_id": row[1],
-                "vendor_name": row[2],
-                "amount": row[3],
-                "currency": row[4],
-                "decision": decision,
-                "notes": row[6],
-                "reviewer": row[7],
-                "decided_at": row[8]
-            }
-            
-            if decision in history:
-                history[decision].append(item)
+        with self._lock:
+            cursor = self._conn.cursor()
+            
+            # One index range scan per decision, newest first
+            for decision, items in history.items():
+                cursor.execute(_SELECT_DECISIONS, (decision,))
                 
+                for row in cursor.fetchall():
+                    item = dict(row)
+                    item["decided_at"] = _iso(item["decided_at"])
+                    items.append(item)
+        
         return history
 
 
-# Global instance
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """Content hash of an invoice payload (canonical JSON, key order ignored)"""
+    canonical = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+class AuditBuffer:
+    """
+    Buffers audit log entries in memory and writes them in batches.
+    Entries are flushed when max_size is reached, flush_interval seconds
+    after the first buffered entry, on an explicit flush() and at exit.
+    """
+    
+    def __init__(self, db: CheckpointDB, max_size: int = 500, flush_interval: float = 30.0):
+        self.db = db
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._rows: List[tuple] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_loop = None
+        self._inflight: set = set()
+        atexit.register(self.flush)
+    
+    def append(
+        self,
+        workflow_id: str,
+        stage: str,
+        action: str,
+        details: Optional[Dict[str, Any]] = None
+    ):
+        """Buffer an audit entry, timestamped now"""
+        row = (workflow_id, stage, action, details, _now_us())
+        with self._lock:
+            self._rows.append(row)
+            size = len(self._rows)
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        
+        if loop is None:
+            if size >= self.max_size:
+                self.flush()
+        elif size >= self.max_size:
+            self._flush_in_background()
+        elif self._timer is None or self._timer_loop is not loop:
+            # Arm the interval flush on the running loop
+            self._timer = loop.call_later(self.flush_interval, self._flush_in_background)
+            self._timer_loop = loop
+    
+    def _take(self) -> List[tuple]:
+        """Disarm the timer and take ownership of the buffered rows"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        with self._lock:
+            rows, self._rows = self._rows, []
+        return rows
+    
+    def _flush_in_background(self):
+        """Start writing buffered entries on a worker thread"""
+        rows = self._take()
+        if rows:
+            write = asyncio.get_running_loop().run_in_executor(
+                None, self.db.add_audit_log_batch, rows
+            )
+            self._inflight.add(write)
+            write.add_done_callback(self._inflight.discard)
+    
+    async def flush_async(self):
+        """Write all buffered entries without blocking the event loop"""
+        rows = self._take()
+        if rows:
+            await asyncio.to_thread(self.db.add_audit_log_batch, rows)
+        # Background writes must land before callers read the log back
+        loop = asyncio.get_running_loop()
+        inflight = [write for write in self._inflight if write.get_loop() is loop]
+        if inflight:
+            await asyncio.gather(*inflight)
+    
+    def flush(self):
+        """Write all buffered entries to the database"""
+        rows = self._take()
+        if rows:
+            self.db.add_audit_log_batch(rows)
+
+
+# Global instances
 checkpoint_db = CheckpointDB()
+audit_buffer = AuditBuffer(checkpoint_db)
@@ -0,0 +1,48 @@
+"""
+TTL Cache
+Small in-process cache with per-entry expiry and LRU eviction
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import time
+
+
+class TTLCache:
+    """
+    Keeps up to maxsize entries, each valid for ttl seconds after it was set.
+    The least recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a cached value, or None if missing or expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Cache a value for ttl seconds"""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Drop one cached entry, if present"""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Drop all cached entries"""
+        self._data.clear()
@@ -2,30 +2,115 @@
 LangGraph Workflow Orchestrator
 Builds and executes the invoice processing graph
 """
-import json
-from typing import Dict, Any, Literal
+import asyncio
+import functools
+import orjson
+from pathlib import Path
+from typing import ClassVar, Dict, Any, List, Literal, Optional, Tuple, Union
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.sqlite import SqliteSaver
 import logging
 
-from .state import InvoiceProcessingState, create_initial_state
+from .state import InvoiceProcessingState, apply_update, create_initial_state
 from .agents.invoice_agents import InvoiceProcessingAgents
 
 logger = logging.getLogger(__name__)
 
+# Conditional edge routes by match result / human decision (anything else
+# takes the default route)
+_CHECKPOINT_ROUTE = {"FAILED": "checkpoint"}
+_HITL_ROUTE = {"REJECT": "reject"}
+
+# Separator line around workflow log banners
+_BANNER = "=" * 80
+
+# Text rendering of the graph built in _build_graph
+_GRAPH_VIZ = """
+Invoice Processing Workflow Graph:
+
+START
+  ↓
+INTAKE (Validate & Persist)
+  ↓
+UNDERSTAND (OCR & Parse)
+  ↓
+PREPARE (Normalize & Enrich)
+  ↓
+RETRIEVE (Fetch ERP Data)
+  ↓
+MATCH_TWO_WAY (Compute Match Score)
+  ↓
+  ├─[MATCHED]──────────────────┐
+  └─[FAILED]                   │
+      ↓                        │
+CHECKPOINT_HITL               │
+      ↓                        │
+HITL_DECISION                 │
+      ↓                        │
+  ├─[ACCEPT]                   │
+  │   ↓                        │
+  │   └────────────────────────┤
+  │                            │
+  └─[REJECT]────────┐          │
+                     │          │
+                     ↓          ↓
+                RECONCILE (Build Entries)
+                     ↓
+                APPROVE (Apply Policy)
+                     ↓
+                POSTING (Post to ERP)
+                     ↓
+                NOTIFY (Send Notifications)
+                     ↓
+                COMPLETE (Finalize)
+                     ↓
+                    END
+
+Legend:
+• Solid lines: Deterministic flow
+• Branches: Conditional routing
+• CHECKPOINT_HITL: Pause for human review
+• HITL_DECISION: Resume based on human input
+"""
+
+
+class CheckpointNotFoundError(ValueError):
+    """Raised when resuming a checkpoint that does not exist"""
+
+
+class CheckpointResolvedError(ValueError):
+    """Raised when resuming a checkpoint that already has a decision"""
+
+
+@functools.lru_cache(maxsize=4)
+def load_json(path: str) -> Dict[str, Any]:
+    """
+    Load and memoize a JSON file (workflow config, sample invoices).
+    The returned dict is shared between callers and must not be mutated.
+    """
+    return orjson.loads(Path(path).read_bytes())
+
 
 class InvoiceProcessingWorkflow:
     """
     Main LangGraph workflow for invoice processing
     """
     
-    def __init__(self, config_path: str = "config/workflow.json"):
-        # Load workflow configuration
-        with open(config_path, 'r') as f:
-            self.workflow_config = json.load(f)
+    # Agents and compiled graph per (config path, config content hash), so
+    # repeat constructions with the same config skip agent setup and compile
+    _GRAPH_CACHE: ClassVar[Dict[Tuple[str, int], Tuple[InvoiceProcessingAgents, Any, Any]]] = {}
+    
+    def __init__(
+        self,
+        config_path: str = "config/workflow.json",
+        workflow_config: Optional[Dict[str, Any]] = None
+    ):
+        # Load workflow configuration (pre-parsed dict takes precedence)
+        if workflow_config is None:
+            workflow_config = load_json(config_path)
+        self.workflow_config = workflow_config
         
         self.config = self.workflow_config.get("config", {})
-        self.agents = InvoiceProcessingAgents(self.config)
         
         # Create checkpoint saver (disabled — using project's CheckpointDB)
         # LangGraph's SqliteSaver context helper returns a context manager
@@ -33,8 +118,19 @@ class InvoiceProcessingWorkflow:
         # `src.tools.checkpoint_db.checkpoint_db` for persistence instead.
         self.memory = None
         
-        # Build the graph
-        self.graph = self._build_graph()
+        # Build the graphs, or reuse the ones compiled for this config
+        cache_key = (
+            config_path,
+            hash(orjson.dumps(self.workflow_config, option=orjson.OPT_SORT_KEYS))
+        )
+        cached = self._GRAPH_CACHE.get(cache_key)
+        if cached is None:
+            self.agents = InvoiceProcessingAgents(self.config)
+            self.graph = self._build_graph()
+            self.resume_graph = self._build_resume_graph()
+            self._GRAPH_CACHE[cache_key] = (self.agents, self.graph, self.resume_graph)
+        else:
+            self.agents, self.graph, self.resume_graph = cached
     
     def _build_graph(self) -> StateGraph:
         """
@@ -98,32 +194,53 @@ class InvoiceProcessingWorkflow:
         # Complete is terminal
         workflow.add_edge("COMPLETE", END)
         
-        # Compile the graph (no LangGraph checkpointer; app uses local DB)
-        return workflow.compile(checkpointer=self.memory)
+        # Compile the graph (no LangGraph checkpointer; app uses local DB).
+        # The graph pauses before HITL_DECISION so a failed match stops at
+        # the checkpoint; the decision is applied by resume_from_checkpoint.
+        return workflow.compile(
+            checkpointer=self.memory,
+            interrupt_before=["HITL_DECISION"]
+        )
+    
+    def _build_resume_graph(self) -> StateGraph:
+        """
+        Build the post-review graph (RECONCILE through COMPLETE) that
+        resume_from_checkpoint runs for accepted checkpoints
+        """
+        workflow = StateGraph(InvoiceProcessingState)
+        
+        workflow.add_node("RECONCILE", self.agents.reconcile_node)
+        workflow.add_node("APPROVE", self.agents.approve_node)
+        workflow.add_node("POSTING", self.agents.posting_node)
+        workflow.add_node("NOTIFY", self.agents.notify_node)
+        workflow.add_node("COMPLETE", self.agents.complete_node)
+        
+        workflow.set_entry_point("RECONCILE")
+        workflow.add_edge("RECONCILE", "APPROVE")
+        workflow.add_edge("APPROVE", "POSTING")
+        workflow.add_edge("POSTING", "NOTIFY")
+        workflow.add_edge("NOTIFY", "COMPLETE")
+        workflow.add_edge("COMPLETE", END)
+        
+        return workflow.compile()
     
+    @staticmethod
     def _should_checkpoint(
-        self,
         state: InvoiceProcessingState
     ) -> Literal["checkpoint", "continue"]:
         """
         Determine if workflow should pause for human review
         """
-        match_result = state.get("match_result", "")
-        if match_result == "FAILED":
-            return "checkpoint"
-        return "continue"
+        return _CHECKPOINT_ROUTE.get(state.get("match_result", ""), "continue")
     
+    @staticmethod
     def _handle_human_decision(
-        self,
         state: InvoiceProcessingState
     ) -> Literal["reconcile", "reject"]:
         """
         Route based on human decision
         """
-        decision = state.get("human_decision", "ACCEPT")
-        if decision == "REJECT":
-            return "reject"
-        return "reconcile"
+        return _HITL_ROUTE.get(state.get("human_decision", "ACCEPT"), "reconcile")
     
     async def run(
         self,
@@ -143,41 +260,76 @@ class InvoiceProcessingWorkflow:
         # Create initial state
         initial_state = create_initial_state(invoice_payload)
         
-        logger.info("=" * 80)
-        logger.info("🚀 STARTING INVOICE PROCESSING WORKFLOW")
-        logger.info("=" * 80)
-        logger.info(f"Invoice ID: {invoice_payload.get('invoice_id')}")
-        logger.info(f"Vendor: {invoice_payload.get('vendor_name')}")
-        logger.info(f"Amount: {invoice_payload.get('currency')} {invoice_payload.get('amount')}")
-        logger.info("=" * 80)
+        if logger.isEnabledFor(logging.INFO):
+            get = invoice_payload.get
+            logger.info(
+                "%s\n🚀 STARTING INVOICE PROCESSING WORKFLOW\n%s\n"
+                "Invoice ID: %s\nVendor: %s\nAmount: %s %s\n%s",
+                _BANNER, _BANNER,
+                get("invoice_id"), get("vendor_name"), get("currency"), get("amount"),
+                _BANNER
+            )
         
         # Run the graph
         config = {"configurable": {"thread_id": thread_id}}
         
         try:
-            # Execute workflow
-            final_state = None
-            # Keep a cumulative state dict so node outputs are merged
-            cumulative_state = dict(initial_state)
-            async for state in self.graph.astream(initial_state, config):
-                # state is a dict with node name as key
-                for node_name, node_state in state.items():
-                    logger.info(f"Completed node: {node_name}")
-                    # merge node outputs into cumulative state
-                    if isinstance(node_state, dict):
-                        cumulative_state.update(node_state)
-                    final_state = cumulative_state
+            # Execute workflow. "updates" yields only each node's delta, which
+            # is merged into the state with the same reducers the graph uses
+            final_state = initial_state
+            log_nodes = logger.isEnabledFor(logging.INFO)
+            async for chunk in self.graph.astream(initial_state, config, stream_mode="updates"):
+                for node_name, delta in chunk.items():
+                    if node_name == "__interrupt__":
+                        if log_nodes:
+                            logger.info("⏸️  Workflow paused for human review")
+                        continue
+                    if log_nodes:
+                        logger.info("Completed node: %s", node_name)
+                    if delta:
+                        apply_update(final_state, delta)
             
-            logger.info("=" * 80)
-            logger.info("✅ Workflow execution completed")
-            logger.info("=" * 80)
+            if log_nodes:
+                logger.info("%s\n✅ Workflow execution completed\n%s", _BANNER, _BANNER)
             
             return final_state
         
         except Exception as e:
-            logger.error(f"❌ Workflow execution failed: {str(e)}")
+            logger.error("❌ Workflow execution failed: %s", e)
             raise
     
+    async def process_batch(
+        self,
+        payloads: List[Dict[str, Any]],
+        concurrency: int = 8
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Process independent invoices concurrently
+        
+        Args:
+            payloads: Invoice payloads to process
+            concurrency: Max workflows in flight at once
+            
+        Returns:
+            Final state per payload, in input order (or the exception
+            that invoice's workflow raised)
+        """
+        sem = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(
+            *[self._run_one(payload, sem, f"batch_{i}") for i, payload in enumerate(payloads)],
+            return_exceptions=True
+        )
+    
+    async def _run_one(
+        self,
+        invoice_payload: Dict[str, Any],
+        sem: asyncio.Semaphore,
+        thread_id: str
+    ) -> Dict[str, Any]:
+        """Run one workflow once a batch slot is free"""
+        async with sem:
+            return await self.run(invoice_payload, thread_id=thread_id)
+    
     async def resume_from_checkpoint(
         self,
         checkpoint_id: str,
@@ -196,119 +348,88 @@ class InvoiceProcessingWorkflow:
             
         Returns:
             Final workflow state
+            
+        Raises:
+            CheckpointNotFoundError: No checkpoint with this ID
+            CheckpointResolvedError: The checkpoint already has a decision
         """
-        from .tools.checkpoint_db import checkpoint_db
-        
-        # Get checkpoint from database
-        checkpoint_data = checkpoint_db.get_checkpoint(checkpoint_id)
+        from .tools.checkpoint_db import audit_buffer, checkpoint_db
         
-        if not checkpoint_data:
-            raise ValueError(f"Checkpoint {checkpoint_id} not found")
-        
-        # Record the decision
-        checkpoint_db.record_decision(
+        # Record the decision and load the checkpoint in one transaction
+        checkpoint_data = await asyncio.to_thread(
+            checkpoint_db.claim_checkpoint,
             checkpoint_id=checkpoint_id,
             decision=decision,
             reviewer_id=reviewer_id,
             notes=notes
         )
         
-        # Get the stored state
+        if not checkpoint_data:
+            # Tell a missing checkpoint from a decided one without loading its state
+            meta = await asyncio.to_thread(checkpoint_db.get_checkpoint_meta, checkpoint_id)
+            if meta is None:
+                raise CheckpointNotFoundError(f"Checkpoint {checkpoint_id} not found")
+            raise CheckpointResolvedError(
+                f"Checkpoint {checkpoint_id} already resolved ({meta['decision']})"
+            )
+        
+        # Get the stored state (the audit log channel is a tuple; JSON gives a list)
         stored_state = checkpoint_data["state"]
+        stored_state["audit_log"] = tuple(stored_state.get("audit_log", ()))
         
         # Update state with decision
         stored_state["human_decision"] = decision
         stored_state["reviewer_id"] = reviewer_id
         
-        logger.info("=" * 80)
-        logger.info(f"🔄 RESUMING WORKFLOW FROM CHECKPOINT: {checkpoint_id}")
-        logger.info(f"Decision: {decision} by {reviewer_id}")
-        logger.info("=" * 80)
-        
-        # If REJECT, skip to COMPLETE
-        if decision == "REJECT":
-            logger.info("Decision is REJECT - skipping to COMPLETE")
-            stored_state["status"] = "MANUAL_HANDOFF"
-            final_state = await self.agents.complete_node(stored_state)
-            stored_state.update(final_state)
-            return stored_state
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "%s\n🔄 RESUMING WORKFLOW FROM CHECKPOINT: %s\nDecision: %s by %s\n%s",
+                _BANNER, checkpoint_id, decision, reviewer_id, _BANNER
+            )
         
-        # If ACCEPT, continue through remaining stages
-        logger.info("Decision is ACCEPT - continuing workflow")
-        
-        # Manually execute remaining stages in order
-        stages = [
-            ("RECONCILE", self.agents.reconcile_node),
-            ("APPROVE", self.agents.approve_node),
-            ("POSTING", self.agents.posting_node),
-            ("NOTIFY", self.agents.notify_node),
-            ("COMPLETE", self.agents.complete_node)
-        ]
+        try:
+            # If REJECT, skip straight to COMPLETE
+            if decision == "REJECT":
+                logger.info("Decision is REJECT - skipping to COMPLETE")
+                stored_state["status"] = "MANUAL_HANDOFF"
+                apply_update(stored_state, self.agents.complete_sync(stored_state))
+                # The workflow ends here, so persist its audit trail
+                await audit_buffer.flush_async()
+                return stored_state
+            
+            # If ACCEPT, continue through remaining stages
+            logger.info("Decision is ACCEPT - continuing workflow")
+            
+            # Run the remaining stages through the compiled resume graph
+            config = {"configurable": {"thread_id": checkpoint_id}}
+            final_state = stored_state
+            async for chunk in self.resume_graph.astream(stored_state, config, stream_mode="updates"):
+                for delta in chunk.values():
+                    if delta:
+                        apply_update(final_state, delta)
         
-        for stage_name, stage_func in stages:
-            logger.info(f"Executing stage: {stage_name}")
-            try:
-                result = await stage_func(stored_state)
-                if isinstance(result, dict):
-                    stored_state.update(result)
-            except Exception as e:
-                logger.error(f"Error in stage {stage_name}: {e}")
-                raise
+        except Exception as e:
+            logger.error("Error resuming workflow from checkpoint %s: %s", checkpoint_id, e)
+            # Undo the claim so the checkpoint stays open for a retry
+            await asyncio.to_thread(checkpoint_db.release_checkpoint, checkpoint_id)
+            raise
         
-        logger.info("=" * 80)
-        logger.info("✅ Workflow resumed and completed successfully")
-        logger.info("=" * 80)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s\n✅ Workflow resumed and completed successfully\n%s", _BANNER, _BANNER)
         
-        return stored_state
+        return final_state
     
     def get_graph_visualization(self) -> str:
         """
         Get a text representation of the graph structure
         """
-        return """
-Invoice Processing Workflow Graph:
+        return _GRAPH_VIZ
 
-START
-  ↓
-INTAKE (Validate & Persist)
-  ↓
-UNDERSTAND (OCR & Parse)
-  ↓
-PREPARE (Normalize & Enrich)
-  ↓
-RETRIEVE (Fetch ERP Data)
-  ↓
-MATCH_TWO_WAY (Compute Match Score)
-  ↓
-  ├─[MATCHED]──────────────────┐
-  └─[FAILED]                   │
-      ↓                        │
-CHECKPOINT_HITL               │
-      ↓                        │
-HITL_DECISION                 │
-      ↓                        │
-  ├─[ACCEPT]                   │
-  │   ↓                        │
-  │   └────────────────────────┤
-  │                            │
-  └─[REJECT]────────┐          │
-                     │          │
-                     ↓          ↓
-                RECONCILE (Build Entries)
-                     ↓
-                APPROVE (Apply Policy)
-                     ↓
-                POSTING (Post to ERP)
-                     ↓
-                NOTIFY (Send Notifications)
-                     ↓
-                COMPLETE (Finalize)
-                     ↓
-                    END
 
-Legend:
-• Solid lines: Deterministic flow
-• Branches: Conditional routing
-• CHECKPOINT_HITL: Pause for human review
-• HITL_DECISION: Resume based on human input
-"""
+@functools.lru_cache(maxsize=4)
+def get_default_workflow(config_path: str = "config/workflow.json") -> InvoiceProcessingWorkflow:
+    """
+    Shared workflow instance per config path. Callers get the same object,
+    so its config, agents and graphs must not be mutated after creation.
+    """
+    return InvoiceProcessingWorkflow(config_path)